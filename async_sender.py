@@ -0,0 +1,165 @@
+"""
+Asyncio send engine: many Gmail messages.send calls in flight from one thread.
+
+Requests go over aiohttp with the OAuth access token from the same Credentials
+that get_gmail_service() uses. Message building (the CPU-heavy part) runs in a
+worker thread so it never blocks the event loop. Requires `pip install aiohttp`.
+"""
+
+import asyncio
+import json
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+from google.auth.transport.requests import Request
+
+from send_session import SendSession
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, only needed for SEND_MODE = "async"
+    aiohttp = None
+
+GMAIL_SEND_URL = "https://gmail.googleapis.com/gmail/v1/users/me/messages/send"
+REQUEST_TIMEOUT_SECONDS = 60
+
+
+def upload_url(send_url):
+    """Media upload endpoint for a messages.send URL (also for a local fake server)."""
+    if "/upload/" in send_url:
+        return send_url
+    scheme, _, rest = send_url.partition("://")
+    host, _, path = rest.partition("/")
+    return f"{scheme}://{host}/upload/{path}"
+
+
+class AsyncTokenSource:
+    """Hands out a valid access token, refreshing at most once at a time."""
+
+    def __init__(self, creds, refresh_latency=None):
+        self.creds = creds
+        self.refresh_latency = refresh_latency
+        self._lock = asyncio.Lock()
+
+    async def token(self):
+        if not self.creds.valid:
+            async with self._lock:
+                if not self.creds.valid:
+                    started = time.perf_counter()
+                    await asyncio.get_running_loop().run_in_executor(None, self.creds.refresh, Request())
+                    if self.refresh_latency is not None:
+                        self.refresh_latency.record(time.perf_counter() - started)
+        return self.creds.token
+
+
+def _http_error(status, headers, content, uri):
+    info = {k.lower(): v for k, v in headers.items()}
+    info["status"] = str(status)
+    return HttpError(httplib2.Response(info), content, uri=uri)
+
+
+async def _post(http, url, token, payload):
+    headers = {"Authorization": f"Bearer {token}"}
+    if isinstance(payload, bytes):
+        # raw MIME goes to the media upload endpoint as-is, no base64/JSON
+        url = upload_url(url)
+        request = http.post(url, params={"uploadType": "media"}, data=payload,
+                            headers={**headers, "Content-Type": "message/rfc822"})
+    else:
+        request = http.post(url, json=payload, headers=headers)
+    try:
+        async with request as r:
+            content = await r.read()
+            if r.status == 200:
+                return json.loads(content), None
+            return None, _http_error(r.status, r.headers, content, url)
+    except asyncio.TimeoutError:
+        return None, TimeoutError(f"no response from Gmail within {REQUEST_TIMEOUT_SECONDS}s")
+    except aiohttp.ClientError as e:
+        return None, ConnectionError(str(e) or type(e).__name__)
+
+
+async def stream_sends(creds, jobs, session: SendSession, url=GMAIL_SEND_URL):
+    """
+    Send (index, to_email, message) jobs concurrently and yield
+    (job, response, error) for every attempt as it completes. The number of
+    in-flight requests follows session.controller; retries are fed back in
+    from session.retry_queue.
+    """
+    if aiohttp is None:
+        raise RuntimeError('SEND_MODE = "async" needs aiohttp (pip install aiohttp).')
+
+    loop = asyncio.get_running_loop()
+    tokens = AsyncTokenSource(creds, session.metrics.histogram("token_refresh_seconds"))
+    latency = session.metrics.histogram("send_seconds", mode="async")
+    results = asyncio.Queue()
+    done = object()
+    fresh = iter(jobs)
+
+    async def send_one(http, job):
+        try:
+            try:
+                token = await tokens.token()
+                started = time.perf_counter()
+                response, error = await _post(http, url, token, job[2])
+                latency.record(time.perf_counter() - started)
+            except Exception as e:
+                # e.g. RefreshError or an unreadable response: the job still needs an outcome
+                response, error = None, e
+            session.record(job, response, error)
+        finally:
+            session.controller.release()
+        await results.put((job, response, error))
+
+    async def produce(http):
+        tasks = set()
+        exhausted = False
+        try:
+            while True:
+                ready = session.retry_queue.pop_ready(1)
+                if not ready and not exhausted:
+                    ready = await loop.run_in_executor(None, session.take_fresh, fresh, 1)
+                    exhausted = not ready
+                if not ready:
+                    if not tasks and not session.retry_queue:
+                        break
+                    if tasks:
+                        await asyncio.wait(tasks, timeout=session.retry_queue.next_delay(),
+                                           return_when=asyncio.FIRST_COMPLETED)
+                    else:
+                        await asyncio.sleep(session.retry_queue.next_delay())
+                    continue
+
+                await session.controller.acquire_async()
+                try:
+                    await session.admit_async(ready)
+                except BaseException:
+                    session.controller.release()
+                    raise
+                task = asyncio.create_task(send_one(http, ready[0]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
+            await results.put(done)
+
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+    async with aiohttp.ClientSession(timeout=timeout) as http:
+        producer = asyncio.create_task(produce(http))
+        try:
+            while True:
+                item = await results.get()
+                if item is done:
+                    break
+                yield item
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+
+async def send_async(creds, jobs, session: SendSession, url=GMAIL_SEND_URL):
+    async for _ in stream_sends(creds, jobs, session, url):
+        pass
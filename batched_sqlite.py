@@ -0,0 +1,53 @@
+"""
+Shared base for the SQLite state files (send journal, contact history).
+
+The database runs in WAL mode with synchronous=NORMAL, and writes share one
+open transaction that is committed every `commit_every` writes or
+`commit_interval` seconds, whichever comes first. That keeps fsyncs off the
+per-send path; callers that need a write to be durable right away call
+_commit() themselves. One connection is shared by all threads under `_lock`.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class BatchedSQLite:
+    schema = ""  # CREATE statements, run at open
+
+    def __init__(self, path: Path, commit_every=200, commit_interval=2.0):
+        self.path = Path(path)
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+
+        self._db = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.schema)
+        self._db.execute("BEGIN")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def _wrote(self):
+        # call with _lock held after each batched write
+        self._pending += 1
+        if self._pending >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self._commit()
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        self._db.execute("COMMIT")
+        self._db.execute("BEGIN")
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._db.execute("COMMIT")
+            self._db.close()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark address extraction: the original split/scan load_emails() against
+the compiled single-pass iter_emails().
+
+    python benchmarks/bench_extract.py --lines 10000000
+
+--check N instead compares both (and the chunked and parallel paths) on N
+random lists made of address-like fragments, and exits 1 on any difference.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from recipients import iter_emails, parallel_iter_emails  # noqa: E402
+
+FIRST = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy"]
+DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "example.org", "corp.example.co.uk"]
+
+
+def legacy_load_emails(path: Path):
+    # load_emails() as it was before the compiled extractor
+    emails = []
+    seen = set()
+    for line in path.read_text(encoding="utf-8", errors="ignore").splitlines():
+        raw = line.strip()
+        if not raw:
+            continue
+        tokens = [t.strip(" ,;") for t in raw.split()]
+        candidate = ""
+        for t in reversed(tokens):
+            if "@" in t and "." in t.split("@", 1)[-1]:
+                candidate = t
+                break
+        if not candidate:
+            continue
+        candidate = candidate.lower()
+        if candidate not in seen:
+            seen.add(candidate)
+            emails.append(candidate)
+    return emails
+
+
+def write_synthetic(path: Path, lines: int, unique_ratio=0.8, seed=1):
+    rng = random.Random(seed)
+    unique = max(1, int(lines * unique_ratio))
+    with path.open("w", encoding="utf-8") as f:
+        for n in range(lines):
+            k = rng.randrange(unique)
+            name = FIRST[k % len(FIRST)]
+            addr = f"{name}.{k}@{DOMAINS[k % len(DOMAINS)]}"
+            shape = n % 10
+            if shape == 0:
+                f.write("\n")
+            elif shape < 4:
+                f.write(f"{addr}\n")
+            elif shape < 7:
+                f.write(f"{name.title()} Recruiter, Acme Inc\t{addr.upper()},\n")
+            elif shape < 9:
+                f.write(f"{name}@team (shared) ; {addr};\n")
+            else:
+                f.write(f"no address on this line {n}\n")
+
+
+FRAGMENTS = ["a", "B", "x1", "@", "@@", ".", "..", ",", ";", " ", "  ", "\t", "<", ">", "-", "_", "é",
+             # splitlines() boundaries besides \n and \r, and \x1f, which is whitespace but not one
+             "\v", "\f", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029", "\x1f", "\r"]
+
+
+def write_random(path: Path, rng, lines=200):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        for _ in range(lines):
+            f.write("".join(rng.choice(FRAGMENTS) for _ in range(rng.randrange(12))))
+            f.write(rng.choice(["\n", "\n", "\r\n"]))
+
+
+def check(rounds, seed=1):
+    """Compare the legacy and compiled loaders on random lists; returns the number of mismatches."""
+    rng = random.Random(seed)
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "emails.txt"
+        for n in range(rounds):
+            write_random(path, rng)
+            expected = legacy_load_emails(path)
+            outputs = {
+                "iter_emails": list(iter_emails(path)),
+                "chunked": list(iter_emails(path, chunk_size=rng.randrange(1, 64))),
+                "spilled": list(iter_emails(path, max_in_memory=rng.randrange(1, 20))),
+                "parallel": list(parallel_iter_emails(path, workers=2, min_bytes=0)),
+            }
+            for name, got in outputs.items():
+                if got != expected:
+                    mismatches += 1
+                    print(f"round {n}: {name} differs from the legacy loader")
+                    print(f"  input:    {path.read_bytes()!r}")
+                    print(f"  expected: {expected}")
+                    print(f"  got:      {got}")
+    print(f"{rounds} random lists, {mismatches} mismatches")
+    return mismatches
+
+
+def timed(label, fn, lines):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:8.2f}s  {lines / elapsed / 1e6:6.2f} M lines/s  {len(result)} addresses")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=10_000_000)
+    parser.add_argument("--file", type=Path, help="use an existing list instead of a synthetic one")
+    parser.add_argument("--check", type=int, metavar="N", help="compare outputs on N random lists instead")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(1 if check(args.check) else 0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if path is None:
+            path = Path(tmp) / "emails.txt"
+            write_synthetic(path, args.lines)
+        lines = sum(1 for _ in path.open("rb"))
+        print(f"{path}: {lines} lines, {path.stat().st_size / 1e6:.1f} MB")
+
+        old, t_old = timed("legacy", lambda: legacy_load_emails(path), lines)
+        new, t_new = timed("compiled", lambda: list(iter_emails(path)), lines)
+        print(f"speedup    {t_old / t_new:8.2f}x  outputs {'match' if old == new else 'DIFFER'}")
+
+
+if __name__ == "__main__":
+    main()
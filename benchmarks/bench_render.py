@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark personalization: text rendering with str.format_map (parses the
+template on every call) against compiled personalize.Template.render(), and
+whole payloads built per recipient with make_message()-style code against
+MessageTemplate.payload(), in this process and in a render_pool worker pool.
+
+    python benchmarks/bench_render.py --recipients 100000 --attachment-kb 150 --workers 8
+"""
+
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from message_template import MessageTemplate, build_message  # noqa: E402
+from personalize import Template, merge_fields  # noqa: E402
+from render_pool import render_jobs  # noqa: E402
+from recipient_records import Recipient  # noqa: E402
+
+SUBJECT = "{first_name|Hello}, Data Engineer roles at {company}?"
+BODY = """Hi {first_name|there},
+
+I hope you're doing well. I'm reaching out to check if {company} currently has any open or
+upcoming opportunities for a Data Engineer role, perhaps on the {team|data} team.
+
+I've attached my resume for your reference.
+
+Best regards,
+Teja Kandukuri
+"""
+FIRST = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy"]
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli"]
+
+
+def make_recipients(n):
+    return [
+        Recipient(f"{FIRST[k % len(FIRST)]}.{k}@example.com",
+                  {"First Name": FIRST[k % len(FIRST)].title(), "Company": COMPANIES[k % len(COMPANIES)],
+                   "team": "" if k % 3 else "platform"})
+        for k in range(n)
+    ]
+
+
+def format_map_render(text, fields):
+    # closest str.format equivalent: defaults have to be filled in before formatting
+    return text.replace("|Hello}", "}").replace("|there}", "}").replace("|data}", "}").format_map(fields)
+
+
+def timed(label, fn, n):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:8.2f}s  {n / elapsed:10.0f} recipients/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=100_000)
+    parser.add_argument("--attachment-kb", type=int, default=150)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    n = args.recipients
+    recipients = make_recipients(n)
+    field_maps = [merge_fields(r) for r in recipients]
+    for fields in field_maps:
+        fields.setdefault("first_name", "there")
+        fields["team"] = fields.get("team") or "data"
+
+    subject, body = Template(SUBJECT), Template(BODY)
+    t_format = timed("text: format_map", lambda: [(format_map_render(SUBJECT, f), format_map_render(BODY, f))
+                                                  for f in field_maps], n)
+    t_compiled = timed("text: compiled", lambda: [(subject.render(f), body.render(f)) for f in field_maps], n)
+    print(f"text speedup           {t_format / t_compiled:8.2f}x")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        attachment = Path(tmp) / "resume.pdf"
+        attachment.write_bytes(os.urandom(args.attachment_kb * 1024))
+        data = attachment.read_bytes()
+
+        def per_message(sample):
+            for r, f in sample:
+                msg = build_message(r, format_map_render(SUBJECT, f), format_map_render(BODY, f), attachment.name, data)
+                base64.urlsafe_b64encode(msg.as_bytes())
+
+        template = MessageTemplate(SUBJECT, BODY, attachment, media_threshold=None)
+        # full MIME builds are slow; time them on a sample
+        sample = list(zip(recipients, field_maps))[:5_000]
+        t_full = timed("payload: per message", lambda: per_message(sample), len(sample)) / len(sample)
+        t_template = timed("payload: template", lambda: sum(1 for r in recipients if template.payload(r)), n) / n
+        print(f"payload speedup        {t_full / t_template:8.2f}x")
+
+        session = None  # every recipient renders, so render_jobs() never reports a failure
+        t_pool = timed(f"payload: {args.workers} procs", lambda: sum(
+            1 for _ in render_jobs(enumerate(recipients, start=1), template, session, args.workers)), n) / n
+        print(f"pool vs in-process     {t_template / t_pool:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
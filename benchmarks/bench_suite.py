@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the campaign hot path: loading recipient lists,
+building messages, base64 encoding and end-to-end sending through the local
+fake Gmail server (fake_gmail.py).
+
+Every case runs in a fresh process so its peak RSS is its own. Results are
+printed as a table and, with --json, written one JSON object per case (tagged
+with the git commit) so runs can be compared across commits:
+
+    python benchmarks/bench_suite.py --json before.jsonl
+    ... change code ...
+    python benchmarks/bench_suite.py --json after.jsonl --compare before.jsonl
+
+--compare exits with status 1 if any case's throughput dropped by more than
+--tolerance.
+"""
+
+import argparse
+import base64
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from bench_extract import write_synthetic  # noqa: E402
+
+DEFAULT_LINES = [1_000, 100_000, 1_000_000]
+FULL_LINES = DEFAULT_LINES + [10_000_000]
+DEFAULT_ATTACHMENT_KB = [50, 500, 5_000]
+SEND_MODES = ["serial", "batch", "threads", "async"]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def result(case, params, n, seconds, latencies=()):
+    latencies = sorted(latencies)
+    p50, p99 = percentile(latencies, 0.50), percentile(latencies, 0.99)
+    return {
+        "case": case,
+        "params": params,
+        "n": n,
+        "seconds": round(seconds, 4),
+        "throughput": round(n / seconds, 2) if seconds else None,
+        "p50_ms": round(p50 * 1000, 3) if p50 is not None else None,
+        "p99_ms": round(p99 * 1000, 3) if p99 is not None else None,
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def timed_calls(fn, args_list):
+    latencies = []
+    start = time.perf_counter()
+    for args in args_list:
+        t = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - t)
+    return time.perf_counter() - start, latencies
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    # main() keeps its journal, history and dead-letter files in the current directory
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+def attachment_file(tmp, kb):
+    path = Path(tmp) / f"resume-{kb}kb.pdf"
+    path.write_bytes(os.urandom(kb * 1024))
+    return path
+
+
+# --- cases: each runs in its own process and returns one result dict ---
+
+def case_load(lines):
+    from recipients import load_emails
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "emails.txt"
+        write_synthetic(path, lines)
+        start = time.perf_counter()
+        emails = load_emails(path)
+        seconds = time.perf_counter() - start
+    return result("load_emails", {"lines": lines, "addresses": len(emails)}, lines, seconds)
+
+
+def case_make_message(kb, count):
+    import gmail_bulk_send_oauth as app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        attachment = attachment_file(tmp, kb)
+        calls = [(f"person{i}@example.com", app.SUBJECT, app.BODY, attachment) for i in range(count)]
+        seconds, latencies = timed_calls(app.make_message, calls)
+    return result("make_message", {"attachment_kb": kb}, count, seconds, latencies)
+
+
+def case_template(kb, count):
+    import gmail_bulk_send_oauth as app
+    from message_template import MessageTemplate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = MessageTemplate(app.SUBJECT, app.BODY, attachment_file(tmp, kb), media_threshold=None)
+        calls = [(f"person{i}@example.com",) for i in range(count)]
+        seconds, latencies = timed_calls(template.payload, calls)
+    return result("template_payload", {"attachment_kb": kb}, count, seconds, latencies)
+
+
+def case_base64(kb, count):
+    from message_template import build_message
+
+    raw = build_message("person@example.com", "Subject", "Body\n", "a.pdf", os.urandom(kb * 1024)).as_bytes()
+    seconds, latencies = timed_calls(base64.urlsafe_b64encode, [(raw,)] * count)
+    return result("base64_encode", {"attachment_kb": kb, "message_bytes": len(raw)}, count, seconds, latencies)
+
+
+def case_send(mode, recipients, kb, latency):
+    import gmail_bulk_send_oauth as app
+    from fake_gmail import FakeGmail, FakeGmailServer
+    from send_session import SendSession
+
+    latencies = []
+
+    class TimedSession(SendSession):
+        # latency of each send from the moment the sender takes the job to its outcome
+        started = {}
+
+        def take_fresh(self, fresh, size):
+            jobs = super().take_fresh(fresh, size)
+            now = time.perf_counter()
+            for job in jobs:
+                self.started[job[0]] = now
+            return jobs
+
+        def record(self, job, response, error):
+            latencies.append(time.perf_counter() - self.started[job[0]])
+            super().record(job, response, error)
+
+    with tempfile.TemporaryDirectory() as tmp, working_directory(tmp):
+        Path(app.EMAIL_LIST_FILE).write_text("".join(f"person{i}@example.com\n" for i in range(recipients)))
+        Path(app.RESUME_FILE).write_bytes(os.urandom(kb * 1024))
+        gmail = FakeGmail(latency=latency, units_per_second=0, seed=1)
+        with FakeGmailServer(gmail) as server:
+            app.GMAIL_API_ENDPOINT = server.url
+            app.SEND_MODE = mode
+            app.MAX_EMAILS = 0
+            app.DAILY_SEND_LIMIT = 0
+            app.QUOTA_UNITS_PER_SECOND = 1e9  # measure the client, not Gmail's quota
+            app.INITIAL_CONCURRENCY = app.MAX_CONCURRENCY
+            app.PIPELINE_REPORT_SECONDS = None
+            app.METRICS_PORT = None
+            app.SendSession = TimedSession
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                app.main()
+            seconds = time.perf_counter() - start
+            sent = gmail.stats["sent"]
+    return result("send_e2e", {"mode": mode, "attachment_kb": kb, "server_latency": latency}, sent, seconds,
+                  latencies)
+
+
+def run_case(fn, *args):
+    # a fresh interpreter per case keeps peak RSS and warm caches from leaking between cases
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(r):
+    return r["case"], json.dumps({k: v for k, v in r["params"].items() if k not in ("addresses", "message_bytes")},
+                                 sort_keys=True)
+
+
+def compare(results, baseline_path, tolerance):
+    baseline = {case_key(r): r for r in map(json.loads, Path(baseline_path).read_text().splitlines()) if r}
+    regressions = 0
+    print(f"\nvs {baseline_path} (commit {next(iter(baseline.values()), {}).get('commit')}):")
+    for r in results:
+        old = baseline.get(case_key(r))
+        if not old or not old["throughput"] or not r["throughput"]:
+            continue
+        change = r["throughput"] / old["throughput"] - 1
+        flag = "REGRESSION" if change < -tolerance else ""
+        regressions += bool(flag)
+        print(f"  {r['case']:<17} {case_key(r)[1]:<60} {change:+7.1%} {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", help=f"recipient file sizes (default {DEFAULT_LINES})")
+    parser.add_argument("--full", action="store_true", help="include a 10M-line recipient file")
+    parser.add_argument("--attachment-kb", type=int, nargs="+", default=DEFAULT_ATTACHMENT_KB)
+    parser.add_argument("--messages", type=int, default=200, help="messages per build/encode case")
+    parser.add_argument("--send-recipients", type=int, default=300)
+    parser.add_argument("--send-latency", default="fixed:0.02", help="fake server latency spec")
+    parser.add_argument("--modes", nargs="+", default=SEND_MODES, choices=SEND_MODES)
+    parser.add_argument("--only", nargs="+", choices=["load", "build", "encode", "send"])
+    parser.add_argument("--json", type=Path, help="write results here, one JSON object per line")
+    parser.add_argument("--compare", type=Path, help="baseline --json file to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    only = set(args.only or ["load", "build", "encode", "send"])
+    lines = args.lines or (FULL_LINES if args.full else DEFAULT_LINES)
+    cases = []
+    if "load" in only:
+        cases += [(case_load, n) for n in lines]
+    if "build" in only:
+        cases += [(case_make_message, kb, args.messages) for kb in args.attachment_kb]
+        cases += [(case_template, kb, args.messages * 10) for kb in args.attachment_kb]
+    if "encode" in only:
+        cases += [(case_base64, kb, args.messages) for kb in args.attachment_kb]
+    if "send" in only:
+        cases += [(case_send, mode, args.send_recipients, min(args.attachment_kb), args.send_latency)
+                  for mode in args.modes]
+
+    meta = {"commit": git_commit(), "python": platform.python_version(), "cpus": os.cpu_count()}
+    print(f"commit {meta['commit']}, Python {meta['python']}, {meta['cpus']} CPUs")
+    print(f"{'case':<17} {'params':<60} {'n':>9} {'per sec':>11} {'p50 ms':>9} {'p99 ms':>9} {'RSS MB':>7}")
+    results = []
+    for fn, *case_args in cases:
+        r = dict(run_case(fn, *case_args), **meta)
+        results.append(r)
+        fmt = lambda v: "-" if v is None else v  # noqa: E731
+        print(f"{r['case']:<17} {json.dumps(r['params']):<60} {r['n']:>9} {fmt(r['throughput']):>11} "
+              f"{fmt(r['p50_ms']):>9} {fmt(r['p99_ms']):>9} {r['peak_rss_mb']:>7}", flush=True)
+
+    if args.json:
+        args.json.write_text("".join(json.dumps(r) + "\n" for r in results))
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
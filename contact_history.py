@@ -0,0 +1,75 @@
+"""
+Cross-campaign contact history (SQLite, WAL mode).
+
+The send journal only knows about one campaign; this store keeps the last time
+each address was emailed by any run, so overlapping lists can skip people
+contacted within a cooldown window. Addresses are the primary key of a
+WITHOUT ROWID table, so a lookup is one B-tree seek however many rows there
+are, and an index on the send time lets old rows expire with a single range
+delete.
+"""
+
+import itertools
+import time
+
+from batched_sqlite import BatchedSQLite
+
+DAY_SECONDS = 24 * 60 * 60
+LOOKUP_BATCH = 500  # addresses per IN (...) query, below SQLite's bound-parameter limit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    email     TEXT PRIMARY KEY,
+    last_sent REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS contacts_last_sent ON contacts (last_sent);
+"""
+
+
+class ContactHistory(BatchedSQLite):
+    schema = SCHEMA
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+
+    def recently_contacted(self, emails, cooldown_days):
+        """Return the subset of `emails` contacted within the last `cooldown_days`."""
+        cutoff = time.time() - cooldown_days * DAY_SECONDS
+        emails = list(emails)
+        query = ("SELECT email FROM contacts WHERE last_sent >= ? AND email IN (%s)"
+                 % ",".join("?" * len(emails)))
+        with self._lock:
+            return {email for (email,) in self._db.execute(query, (cutoff, *emails))}
+
+    def filter(self, emails, cooldown_days, batch_size=LOOKUP_BATCH):
+        """Yield the emails not contacted within the last `cooldown_days`, looked up a batch at a time."""
+        emails = iter(emails)
+        while True:
+            batch = list(itertools.islice(emails, batch_size))
+            if not batch:
+                return
+            recent = self.recently_contacted(batch, cooldown_days)
+            yield from (email for email in batch if email not in recent)
+
+    def sent_since(self, since):
+        """Send times (epoch seconds) at or after `since`, one per address (its latest)."""
+        with self._lock:
+            return [t for (t,) in self._db.execute("SELECT last_sent FROM contacts WHERE last_sent >= ?", (since,))]
+
+    def record(self, email, when=None):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO contacts (email, last_sent) VALUES (?, ?) "
+                "ON CONFLICT(email) DO UPDATE SET last_sent = max(last_sent, excluded.last_sent)",
+                (email, time.time() if when is None else when),
+            )
+            self._wrote()
+
+    def expire(self, older_than_days):
+        """Delete every row last contacted more than `older_than_days` ago; returns how many."""
+        cutoff = time.time() - older_than_days * DAY_SECONDS
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM contacts WHERE last_sent < ?", (cutoff,)).rowcount
+            self._commit()
+        return deleted
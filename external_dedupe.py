@@ -0,0 +1,104 @@
+"""
+Order-preserving de-duplication that spills to disk.
+
+Up to `max_in_memory` distinct values are tracked in a set and emitted as soon
+as they are seen. Past that, values not already in the set are written with
+their sequence number to hash-partitioned files; at the end each partition is
+de-duplicated on its own (a value always lands in the same partition) and the
+partitions are merged back by sequence number. Peak memory is the in-memory set
+plus one partition, and the output is exactly what a single set would give.
+"""
+
+import heapq
+import shutil
+import tempfile
+import zlib
+from pathlib import Path
+
+DEFAULT_PARTITIONS = 64
+
+
+class Dedupe:
+    def __init__(self, max_in_memory=None, partitions=DEFAULT_PARTITIONS, tmp_dir=None):
+        self.max_in_memory = max_in_memory
+        self.partitions = partitions
+        self.tmp_dir = tmp_dir
+        self.seen = set()
+        self.spilled = 0
+        self._seq = 0
+        self._dir = None
+        self._files = None
+
+    def add(self, values):
+        """Return the values from `values` that can be emitted now, in order."""
+        new = [v for v in dict.fromkeys(values) if v not in self.seen]
+        if self.max_in_memory is None:
+            self.seen.update(new)
+            return new
+
+        room = max(0, self.max_in_memory - len(self.seen))
+        emit, rest = new[:room], new[room:]
+        self.seen.update(emit)
+        if rest:
+            self._spill(rest)
+        return emit
+
+    def _spill(self, values):
+        if self._files is None:
+            self._dir = Path(tempfile.mkdtemp(prefix="dedupe-", dir=self.tmp_dir))
+            self._files = [
+                (self._dir / f"part-{n:03d}.tsv").open("w", encoding="utf-8")
+                for n in range(self.partitions)
+            ]
+        for v in values:
+            self._files[zlib.crc32(v.encode("utf-8")) % self.partitions].write(f"{self._seq}\t{v}\n")
+            self._seq += 1
+        self.spilled += len(values)
+
+    def finish(self):
+        """Yield the spilled values that are unique, in first-seen order, then clean up."""
+        if self._files is None:
+            return
+        try:
+            for f in self._files:
+                f.close()
+            unique_parts = [self._dedupe_partition(f.name) for f in self._files]
+            readers = [Path(p).open(encoding="utf-8") for p in unique_parts]
+            try:
+                rows = (map(_parse_row, r) for r in readers)
+                for _, value in heapq.merge(*rows):
+                    yield value
+            finally:
+                for r in readers:
+                    r.close()
+        finally:
+            self.close()
+
+    def close(self):
+        """Remove spill files; safe to call more than once."""
+        if self._files is not None:
+            for f in self._files:
+                f.close()
+            self._files = None
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    @staticmethod
+    def _dedupe_partition(name):
+        # rows are already in sequence order, so keeping first occurrences keeps them sorted
+        out = name + ".unique"
+        seen = set()
+        with open(name, encoding="utf-8") as src, open(out, "w", encoding="utf-8") as dst:
+            for row in src:
+                value = row[row.index("\t") + 1:]
+                if value not in seen:
+                    seen.add(value)
+                    dst.write(row)
+        Path(name).unlink()
+        return out
+
+
+def _parse_row(row):
+    seq, _, value = row.rstrip("\n").partition("\t")
+    return int(seq), value
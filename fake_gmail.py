@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gmail API, for load tests and benchmarks without a
+real account.
+
+Implements users.messages.send as JSON ({"raw": ...}), as media upload
+(uploadType=media, multipart or resumable) and inside batch requests, the
+discovery document that points googleapiclient at this server, and an OAuth
+token endpoint (POST /token) for refresh-token grants. Every send is charged
+against a per-user quota bucket using Gmail's unit model (100 units per send,
+GMAIL_UNITS_PER_SECOND per user) and an optional daily send limit; latency and
+429/500/daily-limit errors can be injected at random.
+
+    python fake_gmail.py --port 8765 --latency lognormal:0.15:0.5 --rate-429 0.02
+    # then set GMAIL_API_ENDPOINT = "http://127.0.0.1:8765" in gmail_bulk_send_oauth.py
+
+GET /fake/stats returns the counters as JSON.
+"""
+
+import argparse
+import base64
+import binascii
+import email
+import email.parser
+import email.policy
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from googleapiclient.discovery_cache import get_static_doc
+
+from rate_limit import GMAIL_UNITS_PER_SECOND, SEND_QUOTA_UNITS
+
+SEND_PATH = re.compile(r"^/(?:upload/|resumable/upload/)?gmail/v1/users/([^/]+)/messages/send$")
+BATCH_PATHS = ("/batch", "/batch/gmail/v1")
+TOKEN_PATH = "/token"
+MAX_BATCH_PARTS = 100
+HTTP_REASONS = {200: "OK", 308: "Resume Incomplete", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+                429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+def latency_sampler(spec: str, rng: random.Random):
+    """
+    Parse a latency spec into a zero-argument function returning seconds:
+    "0", "fixed:S", "uniform:LO:HI", "exponential:MEAN" or
+    "lognormal:MEDIAN:SIGMA".
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(":")] if args else []
+    if kind in ("0", "none", ""):
+        return lambda: 0.0
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"unknown latency spec: {spec!r}")
+
+
+def error_body(code, reason, message, domain="global"):
+    status = {400: "INVALID_ARGUMENT", 403: "PERMISSION_DENIED", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL"}
+    return {"error": {"code": code, "message": message, "status": status.get(code, "UNKNOWN"),
+                      "errors": [{"message": message, "domain": domain, "reason": reason}]}}
+
+
+class QuotaBucket:
+    def __init__(self, units_per_second):
+        self.rate = units_per_second
+        self.tokens = units_per_second
+        self.stamp = time.monotonic()
+        self.sent_today = 0
+
+    def take(self, units):
+        """Charge `units`; returns 0.0 if allowed, else seconds until they would be."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= units:
+            self.tokens -= units
+            return 0.0
+        return (units - self.tokens) / self.rate
+
+
+class FakeGmail:
+    """Server state: quota buckets, injected failures and counters. Thread-safe."""
+
+    def __init__(self, latency="0", rate_429=0.0, rate_500=0.0, rate_daily=0.0,
+                 units_per_second=GMAIL_UNITS_PER_SECOND, daily_limit=0, seed=None, token_lifetime=3600):
+        self.rng = random.Random(seed)
+        self.latency = latency_sampler(latency, self.rng)
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.rate_daily = rate_daily
+        self.units_per_second = units_per_second
+        self.daily_limit = daily_limit
+        self.token_lifetime = token_lifetime
+        self.tokens = {}  # issued access token -> the refresh token (user) it was issued for
+        self.buckets = {}
+        self.uploads = {}
+        self.stats = {"requests": 0, "batches": 0, "sent": 0, "sent_bytes": 0, "media_uploads": 0,
+                      "rate_limited": 0, "quota_exceeded": 0, "daily_limit": 0, "server_errors": 0,
+                      "invalid": 0, "token_refreshes": 0}
+        self.recipients = set()
+        self._lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def discovery_document(self, root_url):
+        doc = json.loads(get_static_doc("gmail", "v1"))
+        doc["rootUrl"] = doc["mtlsRootUrl"] = doc["baseUrl"] = root_url.rstrip("/") + "/"
+        return doc
+
+    def issue_token(self, form: bytes):
+        """OAuth refresh_token grant; returns (status, headers, body)."""
+        params = parse_qs(form.decode("utf-8", "replace"))
+        refresh_token = params.get("refresh_token", [None])[0]
+        if params.get("grant_type", [None])[0] != "refresh_token" or not refresh_token:
+            return 400, {}, {"error": "invalid_grant", "error_description": "refresh_token grant required"}
+        access_token = "fake-" + uuid.uuid4().hex
+        with self._lock:
+            self.tokens[access_token] = refresh_token
+            self.stats["token_refreshes"] += 1
+        return 200, {}, {"access_token": access_token, "expires_in": self.token_lifetime, "token_type": "Bearer",
+                         "scope": "https://www.googleapis.com/auth/gmail.send"}
+
+    def send(self, user, raw: bytes):
+        """Process one messages.send; returns (status, headers, body)."""
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self.rng.random()
+            bucket = self.buckets.setdefault(user, QuotaBucket(self.units_per_second))
+            if self.daily_limit and bucket.sent_today >= self.daily_limit:
+                self.stats["daily_limit"] += 1
+                return 403, {}, error_body(403, "dailyLimitExceeded", "Daily user sending limit exceeded.",
+                                           "usageLimits")
+            wait = bucket.take(SEND_QUOTA_UNITS) if self.units_per_second else 0.0
+
+        if wait:
+            self._count("quota_exceeded")
+            return 429, {"Retry-After": str(max(1, math.ceil(wait)))}, error_body(
+                429, "rateLimitExceeded", "User-rate limit exceeded.", "usageLimits")
+        if roll < self.rate_429:
+            self._count("rate_limited")
+            return 429, {"Retry-After": "1"}, error_body(429, "rateLimitExceeded", "Too many requests.",
+                                                         "usageLimits")
+        roll -= self.rate_429
+        if roll < self.rate_500:
+            self._count("server_errors")
+            return 500, {}, error_body(500, "backendError", "Backend Error")
+        roll -= self.rate_500
+        if roll < self.rate_daily:
+            self._count("daily_limit")
+            return 403, {}, error_body(403, "dailyLimitExceeded", "Daily user sending limit exceeded.",
+                                       "usageLimits")
+
+        headers = email.parser.BytesHeaderParser(policy=email.policy.default).parsebytes(raw)
+        to = headers.get("To")
+        if not to:
+            self._count("invalid")
+            return 400, {}, error_body(400, "invalidArgument", "Invalid To header")
+        with self._lock:
+            bucket.sent_today += 1
+            self.stats["sent"] += 1
+            self.stats["sent_bytes"] += len(raw)
+            self.recipients.add(str(to))
+        message_id = uuid.uuid4().hex[:16]
+        return 200, {}, {"id": message_id, "threadId": message_id, "labelIds": ["SENT"]}
+
+    def send_json(self, user, body: bytes):
+        try:
+            raw = base64.urlsafe_b64decode(json.loads(body)["raw"])
+        except (ValueError, KeyError, TypeError, binascii.Error):
+            self._count("invalid")
+            return 400, {}, error_body(400, "invalidArgument", "'raw' RFC822 payload message string or "
+                                                              "uploading message via /upload/* URL required")
+        return self.send(user, raw)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; with Nagle on, keep-alive clients stall ~40ms on each
+    disable_nagle_algorithm = True
+    server: "FakeGmailServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def gmail(self) -> FakeGmail:
+        return self.server.gmail
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _reply(self, status, headers, body):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status, HTTP_REASONS.get(status))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if "Content-Type" not in headers:
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _user(self, user_id):
+        # quota is per user; "me" means whoever the access token belongs to
+        auth = self.headers.get("Authorization", "")
+        token = auth.partition(" ")[2]
+        return self.gmail.tokens.get(token) or auth or user_id
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/fake/stats":
+            with self.gmail._lock:
+                stats = dict(self.gmail.stats, distinct_recipients=len(self.gmail.recipients))
+            self._reply(200, {}, stats)
+        elif path.startswith("/discovery/v1/apis/gmail/v1/rest") or path == "/$discovery/rest":
+            self._reply(200, {}, self.gmail.discovery_document(self.server.url))
+        else:
+            self._reply(404, {}, error_body(404, "notFound", f"{path} not found"))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self._body()
+        if url.path in BATCH_PATHS:
+            return self._batch(body)
+        if url.path == TOKEN_PATH:
+            return self._reply(*self.gmail.issue_token(body))
+        m = SEND_PATH.match(url.path)
+        if not m:
+            return self._reply(404, {}, error_body(404, "notFound", f"{url.path} not found"))
+
+        time.sleep(self.gmail.latency())
+        user = self._user(m.group(1))
+        upload_type = parse_qs(url.query).get("uploadType", [None])[0]
+        if upload_type is None:
+            return self._reply(*self.gmail.send_json(user, body))
+        self.gmail._count("media_uploads")
+        if upload_type == "media":
+            return self._reply(*self.gmail.send(user, body))
+        if upload_type == "multipart":
+            # multipart/related: JSON metadata part, then the message/rfc822 part
+            related = email.message_from_bytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode("latin-1") + b"\r\n\r\n" + body)
+            parts = related.get_payload()
+            return self._reply(*self.gmail.send(user, parts[-1].get_payload(decode=True) or b""))
+        if upload_type == "resumable":
+            upload_id = uuid.uuid4().hex
+            with self.gmail._lock:
+                self.gmail.uploads[upload_id] = (user, bytearray())
+            location = f"{self.server.url}{url.path}?uploadType=resumable&upload_id={upload_id}"
+            return self._reply(200, {"Location": location}, b"")
+        self._reply(400, {}, error_body(400, "invalidArgument", f"unsupported uploadType {upload_type}"))
+
+    def do_PUT(self):
+        # resumable upload chunk: Content-Range: bytes START-END/TOTAL
+        upload_id = parse_qs(urlsplit(self.path).query).get("upload_id", [None])[0]
+        body = self._body()
+        with self.gmail._lock:
+            upload = self.gmail.uploads.get(upload_id)
+        if upload is None:
+            return self._reply(404, {}, error_body(404, "notFound", "unknown upload session"))
+        user, data = upload
+        data += body
+        total = self.headers.get("Content-Range", "").rpartition("/")[2]
+        if total not in ("", "*") and len(data) < int(total):
+            return self._reply(308, {"Range": f"bytes=0-{len(data) - 1}"}, b"")
+        with self.gmail._lock:
+            self.gmail.uploads.pop(upload_id, None)
+        self._reply(*self.gmail.send(user, bytes(data)))
+
+    def _batch(self, body):
+        self.gmail._count("batches")
+        envelope = email.message_from_bytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode("latin-1") + b"\r\n\r\n" + body)
+        parts = envelope.get_payload()
+        if not isinstance(parts, list) or len(parts) > MAX_BATCH_PARTS:
+            return self._reply(400, {}, error_body(400, "invalidArgument",
+                                                   f"a batch holds 1 to {MAX_BATCH_PARTS} requests"))
+        time.sleep(self.gmail.latency())
+
+        boundary = "batch_" + uuid.uuid4().hex
+        out = []
+        for part in parts:
+            request = part.get_payload(decode=True) or b""
+            head, _, payload = request.replace(b"\r\n", b"\n").partition(b"\n\n")
+            request_line = head.split(b"\n", 1)[0].decode("latin-1").split()
+            m = SEND_PATH.match(urlsplit(request_line[1]).path) if len(request_line) > 1 else None
+            if m:
+                status, headers, result = self.gmail.send_json(self._user(m.group(1)), payload)
+            else:
+                status, headers, result = 404, {}, error_body(404, "notFound", "only messages.send is batched")
+            content_id = (part.get("Content-ID") or "").strip("<>")
+            response_headers = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n{response_headers}\r\n"
+                f"{json.dumps(result)}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        self._reply(200, {"Content-Type": f"multipart/mixed; boundary={boundary}"}, "".join(out).encode("utf-8"))
+
+
+class FakeGmailServer(ThreadingHTTPServer):
+    """Threaded HTTP server around a FakeGmail; usable as a context manager that serves in the background."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, gmail: FakeGmail = None, host="127.0.0.1", port=0):
+        super().__init__((host, port), Handler)
+        self.gmail = gmail or FakeGmail()
+        self.url = f"http://{host}:{self.server_address[1]}"
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-gmail", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="0", help='e.g. "fixed:0.1", "uniform:0.05:0.3", "lognormal:0.15:0.5"')
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of sends answered 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="fraction of sends answered 500")
+    parser.add_argument("--rate-daily", type=float, default=0.0, help="fraction of sends answered dailyLimitExceeded")
+    parser.add_argument("--units-per-second", type=float, default=GMAIL_UNITS_PER_SECOND,
+                        help="per-user quota (100 units per send); 0 = unlimited")
+    parser.add_argument("--daily-limit", type=int, default=0, help="sends per user before dailyLimitExceeded; 0 = none")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--token-lifetime", type=int, default=3600, help="seconds each issued access token lasts")
+    args = parser.parse_args()
+
+    gmail = FakeGmail(args.latency, args.rate_429, args.rate_500, args.rate_daily,
+                      args.units_per_second, args.daily_limit, args.seed, args.token_lifetime)
+    server = FakeGmailServer(gmail, args.host, args.port)
+    print(f"Fake Gmail API on {server.url} (set GMAIL_API_ENDPOINT to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(gmail.stats))
+
+
+if __name__ == "__main__":
+    main()
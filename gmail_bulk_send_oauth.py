@@ -7,20 +7,44 @@ First run opens a browser for consent and creates token.json.
 Python 3.8+ recommended (works on 3.12 too)
 """
 
-import time
+import asyncio
 import base64
+import hashlib
+import itertools
+import os
+import time
 from pathlib import Path
-from email.message import EmailMessage
 
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 
-EMAIL_LIST_FILE = "emails.txt"
+from rate_limit import (
+    RateLimiter, DailyLimitReached, ConcurrencyController,
+    GMAIL_UNITS_PER_SECOND, DAY_SECONDS,
+)
+from retry import RetryQueue, DeadLetterFile
+from send_session import SendSession
+from journal import SendJournal
+from contact_history import ContactHistory
+from async_sender import GMAIL_SEND_URL, send_async
+from recipients import load_emails  # noqa: F401  (was defined here; keep it importable)
+from recipient_records import iter_recipients
+from suppression import SuppressionList
+from thread_sender import send_threaded
+from render_pool import render_jobs
+from pipeline import Pipeline, Sink
+from metrics import Metrics
+from token_refresher import TokenRefresher, save_token
+from message_template import MessageTemplate, build_message, send_request
+from personalize import compile_template, escape_header, merge_fields
+
+EMAIL_LIST_FILE = "emails.txt"  # free text, or .csv/.tsv/.jsonl (optionally .gz) with merge fields per recipient
 RESUME_FILE = "Teja K Data Engineer Resume.pdf"
+TOKEN_FILE = "token.json"
 
+# SUBJECT and BODY may use {field} placeholders filled from structured lists, e.g. "Hi {first_name|there},"
 SUBJECT = "Data Engineer – Open Roles | Resume Attached"
 BODY = """Hi,
 
@@ -38,37 +62,46 @@ Best regards,
 Teja Kandukuri
 """
 
-DELAY_SECONDS = 2
+QUOTA_UNITS_PER_SECOND = GMAIL_UNITS_PER_SECOND  # lower this to leave quota for other Gmail clients
+DAILY_SEND_LIMIT = 500  # per rolling 24h, earlier runs included; Gmail consumer accounts; Workspace allows 2000
 MAX_EMAILS = 3  # test first; set 0 to send all
+MISSING_FIELD_POLICY = "error"  # placeholder with no value and no default: "error" (skip recipient), "empty" or "keep"
+
+# "serial" = one request per email, "batch" = Gmail batch requests,
+# "threads" = thread pool with one Gmail client per thread,
+# "async" = concurrent requests over aiohttp (pip install aiohttp)
+SEND_MODE = "serial"
+BATCH_SIZE = 50  # Gmail accepts up to 100 calls per batch; keep sends at 50 or below
+INITIAL_CONCURRENCY = 4  # in-flight sends to start with; grows until Gmail pushes back
+MAX_CONCURRENCY = 32  # upper bound on in-flight sends (capped by BATCH_SIZE in batch mode, THREAD_WORKERS in threads mode)
+THREAD_WORKERS = 16
+LOAD_WORKERS = None  # processes for parsing lists over 64 MB; None = one per CPU, 1 = single process
+DEDUPE_MEMORY_LIMIT = 5_000_000  # distinct addresses kept in RAM; beyond this, de-duplication spills to disk
+RENDER_WORKERS = None  # processes rendering personalized messages; None = one per CPU, 1 = in the sending process
+MEDIA_UPLOAD_BYTES = 512 * 1024  # larger messages are uploaded as raw MIME; None = always base64 JSON
+SUPPRESSION_FILE = "suppression.idx"  # unsubscribes/bounces, managed with `python suppression.py add ...`
+DEAD_LETTER_FILE = "dead_letter.txt"  # recipients that could not be sent; feed back in as EMAIL_LIST_FILE
+JOURNAL_FILE = "send_journal-{campaign}.db"  # per-campaign send state; reruns skip recipients already sent
+CAMPAIGN_ID = None  # names the campaign's journal; None = a hash of SUBJECT, BODY and the attachment
+RESEND_IN_DOUBT = False  # after a crash, resend recipients whose send was started but never confirmed
+HISTORY_FILE = "contact_history.db"  # last send time per address, shared by every campaign
+COOLDOWN_DAYS = 30  # skip anyone emailed by any run within this many days; 0 = no cooldown
+HISTORY_RETENTION_DAYS = 365  # history rows older than this are deleted at start-up
+
+PIPELINE_QUEUE_SIZE = 1000  # items buffered between stages; bounds memory while the sender is the bottleneck
+PIPELINE_REPORT_SECONDS = 30  # print stage throughput and queue depths this often; None = only at the end
+FILTER_WORKERS = 1  # threads checking suppression/journal/cooldown
+TOKEN_REFRESH_LEAD_SECONDS = 600  # renew the access token in the background this long before it expires
+METRICS_PORT = 9464  # Prometheus text format at http://127.0.0.1:9464/metrics while sending; None = off
+
+GMAIL_API_ENDPOINT = None  # e.g. "http://127.0.0.1:8765" to send to a local fake_gmail.py server instead of Gmail
+OFFLINE_SUFFIX = "-offline"  # runs against GMAIL_API_ENDPOINT keep journal, history and dead letters in separate files
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
 
 
-def load_emails(path: Path):
-    emails = []
-    seen = set()
-    for line in path.read_text(encoding="utf-8", errors="ignore").splitlines():
-        raw = line.strip()
-        if not raw:
-            continue
-        # pull the last token that looks like an email
-        tokens = [t.strip(" ,;") for t in raw.split()]
-        candidate = ""
-        for t in reversed(tokens):
-            if "@" in t and "." in t.split("@", 1)[-1]:
-                candidate = t
-                break
-        if not candidate:
-            continue
-        candidate = candidate.lower()
-        if candidate not in seen:
-            seen.add(candidate)
-            emails.append(candidate)
-    return emails
-
-
-def get_gmail_service():
-    token_path = Path("token.json")
+def get_credentials():
+    token_path = Path(TOKEN_FILE)
     cred_path = Path("credentials.json")
 
     creds = None
@@ -83,24 +116,159 @@ def get_gmail_service():
                 raise FileNotFoundError("credentials.json not found (download OAuth Desktop credentials and save here).")
             flow = InstalledAppFlow.from_client_secrets_file(str(cred_path), SCOPES)
             creds = flow.run_local_server(port=0)
-        token_path.write_text(creds.to_json(), encoding="utf-8")
+        save_token(creds, token_path)
 
-    return build("gmail", "v1", credentials=creds)
+    return creds
 
 
-def make_message(to_email: str, subject: str, body: str, attachment_path: Path):
-    msg = EmailMessage()
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.set_content(body)
+def gmail_build_kwargs():
+    """build() arguments that point googleapiclient at GMAIL_API_ENDPOINT's discovery document, if set."""
+    if not GMAIL_API_ENDPOINT:
+        return {}
+    return {"discoveryServiceUrl": f"{GMAIL_API_ENDPOINT}/discovery/v1/apis/{{api}}/{{apiVersion}}/rest",
+            "static_discovery": False}
+
 
-    data = attachment_path.read_bytes()
-    msg.add_attachment(data, maintype="application", subtype="pdf", filename=attachment_path.name)
+def get_gmail_service(creds=None):
+    kwargs = gmail_build_kwargs()
+    if kwargs:
+        kwargs["cache_discovery"] = False
+    return build("gmail", "v1", credentials=creds or get_credentials(), **kwargs)
 
+
+def make_message(to_email: str, subject: str, body: str, attachment_path: Path):
+    fields = merge_fields(to_email)
+    subject = compile_template(subject, escape_header, MISSING_FIELD_POLICY).render(fields)
+    body = compile_template(body, None, MISSING_FIELD_POLICY).render(fields)
+    msg = build_message(to_email, subject, body, attachment_path.name, attachment_path.read_bytes())
     raw = base64.urlsafe_b64encode(msg.as_bytes()).decode("utf-8")
     return {"raw": raw}
 
 
+def campaign_id(subject: str, body: str, attachment_path: Path):
+    """Short fingerprint of the message, so a changed subject, body or attachment starts a new journal."""
+    digest = hashlib.sha256(subject.encode("utf-8") + b"\0" + body.encode("utf-8") + b"\0")
+    with attachment_path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def state_path(name: str):
+    """
+    Path for a state file. Offline runs get their own copy, so fake sends never
+    mark real recipients sent, start their cooldown or count toward the daily limit.
+    """
+    path = Path(name)
+    return path.with_name(path.stem + OFFLINE_SUFFIX + path.suffix) if GMAIL_API_ENDPOINT else path
+
+
+def filter_recipients(emails, suppression, skip, history):
+    """Drop suppressed addresses, ones the journal already handled and ones in their contact cooldown."""
+    if suppression is not None:
+        emails = suppression.filter(emails)
+    emails = (e for e in emails if e not in skip)
+    if COOLDOWN_DAYS:
+        emails = history.filter(emails, COOLDOWN_DAYS)
+    return emails
+
+
+def iter_jobs(numbered, template: MessageTemplate, session: SendSession):
+    latency = session.metrics.histogram("render_seconds")
+    for i, to_email in numbered:
+        started = time.perf_counter()
+        try:
+            payload = template.payload(to_email)
+        except Exception as e:
+            session.fail(i, to_email, e)
+            continue
+        finally:
+            latency.record(time.perf_counter() - started)
+        yield i, to_email, payload
+
+
+def timed_execute(request, latency):
+    started = time.perf_counter()
+    try:
+        return request.execute()
+    finally:
+        latency.record(time.perf_counter() - started)
+
+
+def send_serial(service, jobs, session: SendSession):
+    latency = session.metrics.histogram("send_seconds", mode="serial")
+    fresh = iter(jobs)
+    while True:
+        batch = session.next_jobs(fresh, 1)
+        if not batch:
+            if session.wait_for_retries():
+                continue
+            break
+
+        job = batch[0]
+        session.controller.wait_ready()
+        session.admit(batch)
+        try:
+            response = timed_execute(send_request(service, job[2]), latency)
+        except Exception as e:
+            session.record(job, None, e)
+        else:
+            session.record(job, response, None)
+
+
+def send_batch(service, jobs, session: SendSession, batch_size=BATCH_SIZE):
+    """
+    Send (index, to_email, message) jobs through Gmail batch requests.
+    Each batch holds at most `controller.window` sends, so the batch size
+    grows while Gmail accepts them and shrinks on rate-limit responses.
+    Failed sub-requests go back through the retry queue and are mixed into
+    later batches once due. Media-upload payloads cannot be batched and are
+    sent one by one.
+    """
+    latency = session.metrics.histogram("send_seconds", mode="batch")
+    media_latency = session.metrics.histogram("send_seconds", mode="media")
+    fresh = iter(jobs)
+    while True:
+        session.controller.wait_ready()
+        size = min(batch_size, session.controller.window)
+        remaining = session.limiter.remaining_today()
+        if remaining is not None:
+            size = max(1, min(size, remaining))  # 0 left: one more reservation raises DailyLimitReached
+        chunk = session.next_jobs(fresh, size)
+        if not chunk:
+            if session.wait_for_retries():
+                continue
+            break
+
+        session.admit(chunk)
+        in_flight = {}
+
+        def on_response(request_id, response, exception):
+            session.record(in_flight[request_id], response, exception)
+
+        batch = service.new_batch_http_request(callback=on_response)
+        for job in chunk:
+            if isinstance(job[2], bytes):
+                try:
+                    response = timed_execute(send_request(service, job[2]), media_latency)
+                except Exception as e:
+                    session.record(job, None, e)
+                else:
+                    session.record(job, response, None)
+                continue
+            request_id = str(job[0])
+            in_flight[request_id] = job
+            batch.add(send_request(service, job[2]), request_id=request_id)
+        if not in_flight:
+            continue
+        try:
+            timed_execute(batch, latency)
+        except Exception as e:
+            # the whole batch request failed; none of its sends were answered
+            for job in in_flight.values():
+                session.record(job, None, e)
+
+
 def main():
     emails_path = Path(EMAIL_LIST_FILE)
     resume_path = Path(RESUME_FILE)
@@ -110,25 +278,120 @@ def main():
     if not resume_path.exists():
         raise FileNotFoundError(resume_path)
 
-    recipients = load_emails(emails_path)
-    if MAX_EMAILS:
-        recipients = recipients[:MAX_EMAILS]
-
-    print(f"Sending {len(recipients)} emails via Gmail API (OAuth)...")
-    service = get_gmail_service()
-
-    for i, to_email in enumerate(recipients, start=1):
+    campaign = CAMPAIGN_ID or campaign_id(SUBJECT, BODY, resume_path)
+    journal = SendJournal(state_path(JOURNAL_FILE.format(campaign=campaign)))
+    print(f"Campaign {campaign}: journal {journal.path}")
+    sent, in_doubt = journal.load_state()
+    skip = sent if RESEND_IN_DOUBT else sent | in_doubt
+    if sent or in_doubt:
+        print(f"Journal: {len(sent)} already sent, {len(in_doubt)} in doubt "
+              f"({'resending' if RESEND_IN_DOUBT else 'skipping'} those).")
+
+    suppression = None
+    if Path(SUPPRESSION_FILE).exists():
+        suppression = SuppressionList(Path(SUPPRESSION_FILE))
+        print(f"Suppression list: {len(suppression)} addresses will be skipped.")
+    history = ContactHistory(state_path(HISTORY_FILE))
+    retention_days = max(HISTORY_RETENTION_DAYS, COOLDOWN_DAYS)  # never forget anyone still in their cooldown
+    expired = history.expire(retention_days)
+    if expired:
+        print(f"Contact history: expired {expired} entries older than {retention_days} days.")
+
+    print(f"Sending emails from {emails_path} via Gmail API (OAuth)...")
+    if GMAIL_API_ENDPOINT:
+        print(f"Using the Gmail API at {GMAIL_API_ENDPOINT} (tokens from its /token endpoint).")
+        creds = Credentials(None, refresh_token="offline-test", token_uri=f"{GMAIL_API_ENDPOINT}/token",
+                            client_id="offline-test", client_secret="offline-test", scopes=SCOPES)
+        token_path = None
+    else:
+        creds = get_credentials()
+        token_path = Path(TOKEN_FILE)
+
+    metrics = Metrics()
+    # with more slots than threads, the window would grow on successes no thread can use
+    max_concurrency = min(MAX_CONCURRENCY, THREAD_WORKERS) if SEND_MODE == "threads" else MAX_CONCURRENCY
+    session = SendSession(
+        # sends from earlier runs in the last day count against today's limit too
+        RateLimiter(QUOTA_UNITS_PER_SECOND, daily_limit=DAILY_SEND_LIMIT, metrics=metrics,
+                    sent_times=history.sent_since(time.time() - DAY_SECONDS) if DAILY_SEND_LIMIT else ()),
+        ConcurrencyController(min(INITIAL_CONCURRENCY, max_concurrency), max_limit=max_concurrency, metrics=metrics),
+        RetryQueue(),
+        DeadLetterFile(state_path(DEAD_LETTER_FILE)),
+        journal,
+        history,
+        metrics=metrics,
+    )
+    template = MessageTemplate(SUBJECT, BODY, resume_path, MEDIA_UPLOAD_BYTES, MISSING_FIELD_POLICY)
+    if template.personalized:
+        names = template.subject_template.field_names | template.body_template.field_names
+        print(f"Personalizing with fields: {', '.join(sorted(names))}")
+    if template.use_media:
+        print(f"Message is {len(template.invariant) // 1024} KB; sending as raw MIME media uploads.")
+
+    # load -> filter -> number -> render -> send (this thread) -> record
+    pipeline = Pipeline(iter_recipients(emails_path, LOAD_WORKERS, max_in_memory=DEDUPE_MEMORY_LIMIT),
+                        "load", PIPELINE_QUEUE_SIZE, report_every=PIPELINE_REPORT_SECONDS)
+    pipeline.add("filter", lambda emails: filter_recipients(emails, suppression, skip, history), FILTER_WORKERS)
+    pipeline.add("number", lambda emails: enumerate(itertools.islice(emails, MAX_EMAILS or None), start=1))
+    render_workers = RENDER_WORKERS or os.cpu_count() or 1
+    if template.personalized and render_workers > 1:
+        # static messages only need a To header per recipient; not worth shipping between processes
+        pipeline.add("render", lambda numbered: render_jobs(numbered, template, session, render_workers))
+    else:
+        pipeline.add("render", lambda numbered: iter_jobs(numbered, template, session))
+    session.recorder = Sink("record", session.store, queue_size=PIPELINE_QUEUE_SIZE)
+
+    stages = lambda: dict(pipeline.metrics(), record=session.recorder.metrics())  # noqa: E731
+    metrics.gauge("queue_depth", lambda: {(("stage", name),): m["queue_depth"] for name, m in stages().items()},
+                  "Items waiting in each pipeline stage's output queue")
+    metrics.gauge("sends_in_flight", lambda: {(): session.controller.in_flight}, "Sends awaiting a response")
+    metrics.gauge("concurrency_window", lambda: {(): session.controller.window}, "Current AIMD send window")
+    metrics_server = None
+    if METRICS_PORT:
         try:
-            message = make_message(to_email, SUBJECT, BODY, resume_path)
-            service.users().messages().send(userId="me", body=message).execute()
-            print(f"[{i}] SENT -> {to_email}")
-        except HttpError as e:
-            print(f"[{i}] FAIL -> {to_email} | Gmail API error: {e}")
-        except Exception as e:
-            print(f"[{i}] FAIL -> {to_email} | {e}")
-
-        time.sleep(DELAY_SECONDS)
-
+            metrics_server = metrics.serve(METRICS_PORT)
+            print(f"Metrics at http://127.0.0.1:{metrics_server.server_address[1]}/metrics")
+        except OSError as e:
+            print(f"Metrics endpoint disabled: cannot listen on port {METRICS_PORT} ({e}).")
+
+    # keeps creds.token valid for every sender, so no send refreshes (or waits for) a token inline
+    refresher = TokenRefresher(creds, token_path, TOKEN_REFRESH_LEAD_SECONDS, metrics=metrics).start()
+
+    jobs = iter(pipeline)
+    try:
+        if SEND_MODE == "async":
+            url = f"{GMAIL_API_ENDPOINT}/gmail/v1/users/me/messages/send" if GMAIL_API_ENDPOINT else GMAIL_SEND_URL
+            asyncio.run(send_async(creds, jobs, session, url))
+        elif SEND_MODE == "threads":
+            send_threaded(creds, jobs, session, THREAD_WORKERS, gmail_build_kwargs())
+        elif SEND_MODE == "batch":
+            send_batch(get_gmail_service(creds), jobs, session)
+        else:
+            send_serial(get_gmail_service(creds), jobs, session)
+    except DailyLimitReached as e:
+        print(f"Stopping: {e}")
+    finally:
+        refresher.stop()
+        pipeline.close()
+        unsent = session.release_unsent()
+        if unsent:
+            print(f"{unsent} recipients were not sent and stay eligible for the next run.")
+        session.recorder.close()
+        journal.close()
+        history.close()
+        if suppression is not None:
+            suppression.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+
+    print(f"Pipeline: {pipeline.summary()}")
+    if session.failed:
+        print(f"{session.failed} of {session.sent + session.failed} emails failed; see {session.dead_letter.path}.")
+    print(f"Rate limiter: {session.limiter.summary()}")
+    print(f"Concurrency: {session.controller.summary()}")
+    print(f"Token: {refresher.summary()}")
+    print(f"Latency and errors:\n{metrics.summary()}")
     print("✅ Done.")
 
 
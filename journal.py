@@ -0,0 +1,77 @@
+"""
+Durable per-recipient send journal (SQLite, WAL mode).
+
+Each recipient moves queued -> sent | failed. Queued rows are committed before
+the request goes out, outcome rows are committed in batches, so after a crash
+a rerun knows who was sent, who failed and who is in doubt (queued but never
+confirmed). Each campaign gets its own journal file (see JOURNAL_FILE and
+CAMPAIGN_ID in gmail_bulk_send_oauth.py); the cross-campaign record is the
+contact history.
+"""
+
+import time
+
+from batched_sqlite import BatchedSQLite
+
+QUEUED = "queued"
+SENT = "sent"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sends (
+    email      TEXT PRIMARY KEY,
+    state      TEXT NOT NULL,
+    message_id TEXT,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    error      TEXT,
+    updated    REAL NOT NULL
+)
+"""
+
+
+class SendJournal(BatchedSQLite):
+    schema = SCHEMA
+
+    def load_state(self):
+        """Return ({sent emails}, {queued-but-unconfirmed emails}) for O(1) skip checks."""
+        sent, in_doubt = set(), set()
+        for email, state in self._db.execute("SELECT email, state FROM sends WHERE state != ?", (FAILED,)):
+            (sent if state == SENT else in_doubt).add(email)
+        return sent, in_doubt
+
+    def counts(self):
+        return dict(self._db.execute("SELECT state, COUNT(*) FROM sends GROUP BY state"))
+
+    def mark_queued(self, emails):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO sends (email, state, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(email) DO UPDATE SET state = excluded.state, updated = excluded.updated",
+                ((email, QUEUED, now) for email in emails),
+            )
+            # the queued state must be durable before the send is attempted
+            self._commit()
+
+    def unqueue(self, emails):
+        """Forget queued rows of recipients that were never sent (stopped or still awaiting a retry)."""
+        with self._lock:
+            self._db.executemany("DELETE FROM sends WHERE email = ? AND state = ?",
+                                 ((email, QUEUED) for email in emails))
+            self._commit()
+
+    def mark_sent(self, email, message_id):
+        self._update(email, SENT, message_id, None)
+
+    def mark_failed(self, email, error):
+        self._update(email, FAILED, None, str(error)[:500])
+
+    def _update(self, email, state, message_id, error):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO sends (email, state, message_id, error, attempts, updated) VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT(email) DO UPDATE SET state = excluded.state, message_id = excluded.message_id, "
+                "error = excluded.error, attempts = attempts + 1, updated = excluded.updated",
+                (email, state, message_id, error, time.time()),
+            )
+            self._wrote()
@@ -0,0 +1,184 @@
+"""
+Precompiled campaign message.
+
+Every recipient gets the same subject, body and attachment; only the To header
+differs. MessageTemplate serializes the invariant part of the MIME message once
+and produces each recipient's raw bytes by prepending their To header.
+
+The header block is padded to a multiple of 3 bytes, so its base64 encoding
+ends on a group boundary and the encoded tail (body plus attachment) can be
+computed once and appended as-is.
+
+Large messages skip base64 altogether: payload() returns the raw MIME bytes,
+which send_request() uploads as message/rfc822 media instead of a JSON body.
+
+When SUBJECT or BODY have {field} placeholders, the headers and the text part
+are rendered per recipient from compiled templates, and only the attachment
+part (already encoded, as is its base64 in the JSON payload) is shared. The
+padding after "To:" then covers the whole personalized prefix.
+"""
+
+import base64
+import binascii
+import io
+import re
+from email.message import EmailMessage
+from pathlib import Path
+
+from googleapiclient.http import MediaIoBaseUpload
+
+from personalize import MISSING_ERROR, compile_template, escape_header, merge_fields
+
+MEDIA_UPLOAD_MIN_BYTES = 512 * 1024  # above this, upload raw MIME instead of base64 JSON
+RESUMABLE_UPLOAD_MIN_BYTES = 5 * 1024 * 1024
+
+# addresses that can go into the header verbatim (no folding or encoding needed)
+PLAIN_ADDRESS = re.compile(rb"[!#-'*+\-./0-9=?A-Z^-~]+@[A-Za-z0-9.\-]+")
+TEXT_PART_HEADER = b'Content-Type: text/plain; charset="utf-8"\nContent-Transfer-Encoding: %s\n\n'
+MAX_LINE_BYTES = 78
+
+
+def build_message(to_email, subject: str, body: str, attachment_name: str, attachment_data: bytes):
+    msg = EmailMessage()
+    if to_email is not None:
+        msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content(body)
+    msg.add_attachment(attachment_data, maintype="application", subtype="pdf", filename=attachment_name)
+    return msg
+
+
+def text_part(body: str):
+    """
+    Serialized text/plain part, as MIMEPart.set_content() would write it but
+    without going through the email package's header parsing: 7bit or 8bit
+    when every line fits, quoted-printable otherwise.
+    """
+    lines = body.encode("utf-8").splitlines()
+    data = b"\n".join(lines) + b"\n"
+    if max(map(len, lines), default=0) <= MAX_LINE_BYTES:
+        return TEXT_PART_HEADER % (b"7bit" if data.isascii() else b"8bit") + data
+    return TEXT_PART_HEADER % b"quoted-printable" + binascii.b2a_qp(data)
+
+
+def send_request(service, payload):
+    """Build a messages.send request for a payload from MessageTemplate.payload()."""
+    messages = service.users().messages()
+    if isinstance(payload, (bytes, bytearray)):
+        media = MediaIoBaseUpload(io.BytesIO(payload), mimetype="message/rfc822",
+                                  resumable=len(payload) >= RESUMABLE_UPLOAD_MIN_BYTES)
+        return messages.send(userId="me", media_body=media)
+    return messages.send(userId="me", body=payload)
+
+
+class MessageTemplate:
+    def __init__(self, subject: str, body: str, attachment_path: Path, media_threshold=MEDIA_UPLOAD_MIN_BYTES,
+                 missing=MISSING_ERROR):
+        self.subject_template = compile_template(subject, escape_header, missing)
+        self.body_template = compile_template(body, None, missing)
+        self.personalized = not (self.subject_template.is_static and self.body_template.is_static)
+        self.subject = subject
+        self.body = body
+        self.attachment_name = attachment_path.name
+        self.attachment_data = attachment_path.read_bytes()
+
+        if self.personalized:
+            # everything up to the text part is rendered per recipient; the attachment part is shared
+            skeleton = build_message(None, "", "", self.attachment_name, self.attachment_data)
+            del skeleton["Subject"]
+            raw = skeleton.as_bytes()
+            delimiter = b"\n--" + skeleton.get_boundary().encode("ascii") + b"\n"
+            self._mime_head, _, rest = raw.partition(delimiter)
+            self._mime_head += delimiter
+            self.invariant = delimiter + rest.partition(delimiter)[2]
+        else:
+            # static templates still turn {{ and }} into literal braces
+            self.invariant = build_message(None, self.subject_template.render({}), self.body_template.render({}),
+                                           self.attachment_name, self.attachment_data).as_bytes()
+        self.use_media = media_threshold is not None and len(self.invariant) >= media_threshold
+        # the media path never needs the encoded tail
+        self.encoded_invariant = None if self.use_media else base64.urlsafe_b64encode(self.invariant).decode("ascii")
+
+    def header(self, to_email: str):
+        """The To header padded to a 3-byte multiple, or None if the address needs encoding."""
+        try:
+            addr = to_email.encode("ascii")
+        except UnicodeEncodeError:
+            return None
+        if not PLAIN_ADDRESS.fullmatch(addr):
+            return None
+        # whitespace after the colon is insignificant, so use it as padding
+        pad = -(len(addr) + 5) % 3
+        return b"To:" + b" " * (1 + pad) + addr + b"\n"
+
+    def full_message(self, to_email: str):
+        fields = merge_fields(to_email)
+        return build_message(to_email, self.subject_template.render(fields), self.body_template.render(fields),
+                             self.attachment_name, self.attachment_data)
+
+    def personal_prefix(self, to_email: str):
+        """Headers, MIME head and rendered text part for one recipient, padded to a 3-byte multiple."""
+        fields = merge_fields(to_email)
+        subject = self.subject_template.render(fields)
+        body = text_part(self.body_template.render(fields))
+
+        header = self.header(to_email)
+        if header is not None and subject.isascii() and subject.isprintable() and len(subject) <= 68:
+            headers = to_email.encode("ascii") + b"\nSubject: " + subject.encode("ascii") + b"\n"
+        else:
+            # let the email package encode/fold the address and subject
+            headers = EmailMessage()
+            headers["To"] = to_email
+            headers["Subject"] = subject
+            headers = headers.as_bytes()[len(b"To: "):-1]
+        rest = headers + self._mime_head + body
+        pad = -(len(rest) + 4) % 3
+        return b"To:" + b" " * (1 + pad) + rest
+
+    def raw_bytes(self, to_email: str):
+        if self.personalized:
+            return self.personal_prefix(to_email) + self.invariant
+        header = self.header(to_email)
+        if header is None:
+            # unusual address: let the email package quote/encode the header
+            return self.full_message(to_email).as_bytes()
+        return header + self.invariant
+
+    def message(self, to_email: str):
+        if self.personalized:
+            header = self.personal_prefix(to_email)
+            return {"raw": base64.urlsafe_b64encode(header).decode("ascii") + self.encoded_invariant}
+        header = self.header(to_email)
+        if header is None or self.encoded_invariant is None:
+            raw = base64.urlsafe_b64encode(self.raw_bytes(to_email)).decode("ascii")
+        else:
+            raw = base64.urlsafe_b64encode(header).decode("ascii") + self.encoded_invariant
+        return {"raw": raw}
+
+    def payload(self, to_email: str):
+        """Raw MIME bytes for media upload on large campaigns, else the {"raw": ...} JSON body."""
+        if self.use_media:
+            return self.raw_bytes(to_email)
+        return self.message(to_email)
+
+    def payload_head(self, to_email: str):
+        """
+        The per-recipient part of payload(): (head, shares_tail). This is all a
+        render worker has to compute and send back; join_payload() adds the
+        shared tail.
+        """
+        if self.personalized:
+            head, shared = self.personal_prefix(to_email), True
+        else:
+            head = self.header(to_email)
+            shared = head is not None
+            if not shared:
+                head = self.full_message(to_email).as_bytes()
+        if self.use_media:
+            return head, shared
+        return base64.urlsafe_b64encode(head).decode("ascii"), shared
+
+    def join_payload(self, head, shares_tail):
+        if self.use_media:
+            return head + self.invariant if shares_tail else head
+        return {"raw": head + self.encoded_invariant if shares_tail else head}
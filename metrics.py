@@ -0,0 +1,220 @@
+"""
+In-process instrumentation: latency histograms, labelled counters and gauges,
+exported in the Prometheus text format on a local HTTP endpoint and as an
+end-of-run summary.
+
+Histograms are HDR-style: values are kept in microseconds in log-linear
+buckets (16 per power of two, so every value is within ~6% of its bucket's
+bounds) in one fixed-size list. Recording is a bit_length(), a shift and an
+increment under an uncontended lock, about a microsecond, so it stays on in
+production. Components take handles once (metrics.histogram(...)) and call
+record() on the hot path.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAMESPACE = "bulk_email"
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_MICROS = (1 << 40) - 1  # ~12.7 days; larger values are clamped
+BUCKETS = ((MAX_MICROS.bit_length() - SUB_BUCKET_BITS) << SUB_BUCKET_BITS) + SUB_BUCKETS
+EXPORT_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def bucket_index(micros):
+    if micros < 2 * SUB_BUCKETS:
+        return micros
+    shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift << SUB_BUCKET_BITS) + (micros >> shift)
+
+
+def bucket_lower(index):
+    """Smallest microsecond value that lands in bucket `index`."""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    return (index - (shift << SUB_BUCKET_BITS)) << shift
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        micros = min(MAX_MICROS, max(0, int(seconds * 1e6)))
+        index = bucket_index(micros)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (capped at the max seen), in seconds."""
+        with self._lock:
+            counts, count, largest = list(self.counts), self.count, self.max
+        if not count:
+            return 0.0
+        rank = max(1, round(q * count))
+        seen = 0
+        for index, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return min(largest, (bucket_lower(index + 1) - 1) / 1e6)
+        return largest
+
+    def cumulative(self, bounds):
+        """[(bound in seconds, number of values <= bound)] for Prometheus-style buckets."""
+        with self._lock:
+            counts = list(self.counts)
+        out, seen, index = [], 0, 0
+        for bound in bounds:
+            limit = bound * 1e6
+            while index < BUCKETS and bucket_lower(index + 1) - 1 <= limit:
+                seen += counts[index]
+                index += 1
+            out.append((bound, seen))
+        return out
+
+
+def _duration(seconds):
+    if seconds < 0.001:
+        return f"{seconds * 1e6:.0f}us"
+    if seconds < 1:
+        return f"{seconds * 1000:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")  # noqa: E731
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    def __init__(self, namespace=NAMESPACE):
+        self.namespace = namespace
+        self._histograms = {}  # name -> {labels: Histogram}
+        self._counters = {}  # name -> {labels: value}
+        self._gauges = {}  # name -> fn() returning {((label, value), ...): gauge value}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help="", **labels):
+        """Get (creating on first use) the histogram for `name` and `labels`; keep the handle."""
+        key = _labels(labels)
+        with self._lock:
+            family = self._histograms.setdefault(name, {})
+            if help:
+                self._help[name] = help
+            if key not in family:
+                family[key] = Histogram()
+            return family[key]
+
+    def count(self, name, n=1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            family = self._counters.setdefault(name, {})
+            family[key] = family.get(key, 0) + n
+
+    def describe(self, name, help):
+        self._help[name] = help
+
+    def gauge(self, name, fn, help=""):
+        """Register fn() -> {((label, value), ...): gauge value}, evaluated at export time."""
+        with self._lock:
+            self._gauges[name] = fn
+            if help:
+                self._help[name] = help
+
+    def prometheus(self):
+        lines = []
+
+        def header(name, kind):
+            full = f"{self.namespace}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full} {self._help[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        with self._lock:
+            histograms = {name: dict(family) for name, family in self._histograms.items()}
+            counters = {name: dict(family) for name, family in self._counters.items()}
+            gauges = dict(self._gauges)
+
+        for name, family in sorted(histograms.items()):
+            full = header(name, "histogram")
+            for labels, h in sorted(family.items()):
+                for bound, n in h.cumulative(EXPORT_BOUNDS):
+                    lines.append(f"{full}_bucket{_format_labels(labels, [('le', bound)])} {n}")
+                lines.append(f"{full}_bucket{_format_labels(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {h.total:.6f}")
+                lines.append(f"{full}_count{_format_labels(labels)} {h.count}")
+        for name, family in sorted(counters.items()):
+            full = header(name, "counter")
+            for labels, value in sorted(family.items()):
+                lines.append(f"{full}{_format_labels(labels)} {value}")
+        for name, fn in sorted(gauges.items()):
+            try:
+                values = fn()
+            except Exception:
+                continue  # a gauge whose source has gone away is simply not exported
+            full = header(name, "gauge")
+            for labels, value in values.items():
+                lines.append(f"{full}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Human-readable latency percentiles and counters for the end of a run."""
+        lines = []
+        with self._lock:
+            histograms = sorted((name, labels, h) for name, family in self._histograms.items()
+                                for labels, h in family.items())
+            counters = sorted((name, labels, v) for name, family in self._counters.items()
+                              for labels, v in family.items())
+        for name, labels, h in histograms:
+            if h.count:
+                lines.append(
+                    f"{name}{_format_labels(labels)}: n={h.count} p50={_duration(h.percentile(0.5))} "
+                    f"p90={_duration(h.percentile(0.9))} p99={_duration(h.percentile(0.99))} "
+                    f"max={_duration(h.max)} total={_duration(h.total)}"
+                )
+        for name, labels, value in counters:
+            lines.append(f"{name}{_format_labels(labels)}: {value}")
+        return "\n".join(lines)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve GET /metrics in a background thread; returns the server (call shutdown() to stop)."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
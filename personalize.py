@@ -0,0 +1,115 @@
+"""
+Compiled personalization templates for SUBJECT and BODY.
+
+Placeholders look like str.format fields: "Hi {first_name}," with an optional
+default after a bar, "{first_name|there}". Write "{{" and "}}" for literal
+braces. A template is parsed once into a list of literal parts with slots at
+known positions; rendering copies the list, fills the slots and joins it.
+
+Field names are matched case-insensitively with spaces and dashes read as
+underscores, so a CSV column "First Name" fills {first_name}. Every recipient
+also has an {email} field.
+"""
+
+import functools
+import re
+
+MISSING_ERROR = "error"  # raise MissingField; the recipient is reported as failed, nothing is sent
+MISSING_EMPTY = "empty"  # render the slot as ""
+MISSING_KEEP = "keep"  # leave the placeholder text in place
+
+PLACEHOLDER = re.compile(r"\{\{|\}\}|\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*(?:\|([^{}]*))?\}")
+_LINE_BREAKS = re.compile(r"\s*[\r\n]+\s*")
+
+
+class MissingField(KeyError):
+    pass
+
+
+def escape_header(value: str):
+    """Fold line breaks into spaces so a field value can never start a new header."""
+    return _LINE_BREAKS.sub(" ", value).strip()
+
+
+def field_key(name):
+    return str(name).strip().lower().replace(" ", "_").replace("-", "_")
+
+
+def merge_fields(recipient):
+    """The lookup mapping for one recipient: its row's fields under normalized names, plus email."""
+    fields = {field_key(k): v for k, v in getattr(recipient, "fields", {}).items()}
+    fields["email"] = str(recipient)
+    return fields
+
+
+class Template:
+    def __init__(self, text: str, escape=None, missing=MISSING_ERROR):
+        if missing not in (MISSING_ERROR, MISSING_EMPTY, MISSING_KEEP):
+            raise ValueError(f"unknown missing-field policy: {missing!r}")
+        self.text = text
+        self.escape = escape
+        self.missing = missing
+        self.parts = []
+        self.slots = []  # (index into parts, field name, default or None, placeholder text)
+
+        literal = []
+        pos = 0
+        for m in PLACEHOLDER.finditer(text):
+            literal.append(self._literal(text, pos, m.start()))
+            pos = m.end()
+            if m.group(1) is None:
+                literal.append(m.group(0)[0])  # escaped brace
+                continue
+            self.parts.append("".join(literal))
+            literal = []
+            self.slots.append((len(self.parts), field_key(m.group(1)), m.group(2), m.group(0)))
+            self.parts.append("")
+        literal.append(self._literal(text, pos, len(text)))
+        self.parts.append("".join(literal))
+
+    @staticmethod
+    def _literal(text, start, end):
+        # text between placeholders; a brace here is a typo'd placeholder, not something to send
+        chunk = text[start:end]
+        for brace in "{}":
+            at = chunk.find(brace)
+            if at >= 0:
+                raise ValueError(f"unmatched {brace!r} at offset {start + at} in template (write {brace * 2} for a literal brace)")
+        return chunk
+
+    @property
+    def is_static(self):
+        return not self.slots
+
+    @property
+    def field_names(self):
+        return {name for _, name, _, _ in self.slots}
+
+    def render(self, fields):
+        """Fill the slots from `fields` (as returned by merge_fields())."""
+        if not self.slots:
+            return self.parts[0]
+        out = self.parts.copy()
+        escape = self.escape
+        for index, name, default, placeholder in self.slots:
+            value = fields.get(name)
+            if value is None or value == "":
+                if default is not None:
+                    value = default
+                elif self.missing == MISSING_EMPTY:
+                    value = ""
+                elif self.missing == MISSING_KEEP:
+                    out[index] = placeholder
+                    continue
+                else:
+                    raise MissingField(f"no value for {{{name}}} (recipient {fields.get('email')})")
+            elif not isinstance(value, str):
+                value = str(value)
+            out[index] = escape(value) if escape is not None else value
+        return "".join(out)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(text: str, escape=None, missing=MISSING_ERROR):
+    """Template(text, ...), parsed once per distinct text and settings."""
+    return Template(text, escape, missing)
@@ -0,0 +1,213 @@
+"""
+Campaign pipeline: stages running in their own threads, connected by bounded
+queues.
+
+Each stage is a function from an iterator of inputs to an iterator of outputs
+(so generators such as the loaders and filters plug in unchanged) run by one
+or more worker threads that share the stage's input queue. A stage blocks when
+its output queue is full, so the slowest stage sets the pace and memory is
+bounded by the queue sizes. The final stage's output is read by iterating the
+pipeline; a Sink is a stage fed by put() instead (used to record outcomes off
+the send path).
+
+metrics() reports every queue's depth and each stage's throughput.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+
+DEFAULT_QUEUE_SIZE = 1000
+POLL_SECONDS = 0.2  # how often blocked workers check whether the pipeline was stopped
+
+_DONE = object()
+
+
+class StageError(RuntimeError):
+    pass
+
+
+def process_pool_context():
+    """
+    Start method for process pools created inside stages. Forking while the
+    sender, metrics and token threads hold locks can deadlock the child, so
+    use a fork server where available and spawn elsewhere (Windows).
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.output = queue.Queue(queue_size)
+        self.items_out = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def metrics(self):
+        return {"workers": self.workers, "running": self.running, "items_out": self.items_out,
+                "queue_depth": self.output.qsize(), "queue_size": self.output.maxsize}
+
+
+class Pipeline:
+    def __init__(self, source, name="load", queue_size=DEFAULT_QUEUE_SIZE, report_every=None):
+        self.stages = [Stage(name, lambda _: iter(source), 1, queue_size)]
+        self.report_every = report_every
+        self.error = None
+        self.started = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def add(self, name, fn, workers=1, queue_size=None):
+        """Append a stage: fn(iterator of the previous stage's items) -> iterator of items."""
+        if self.started is not None:
+            raise RuntimeError("cannot add stages to a running pipeline")
+        queue_size = queue_size or self.stages[-1].output.maxsize
+        self.stages.append(Stage(name, fn, workers, queue_size))
+        return self
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, q):
+        # input iterator shared by all workers of the next stage
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                q.put(_DONE)  # let the stage's other workers see it too
+                return
+            yield item
+
+    def _work(self, stage, inputs):
+        outputs = None
+        try:
+            outputs = stage.fn(inputs)
+            for item in outputs:
+                if not self._put(stage.output, item):
+                    break
+                stage.items_out += 1
+        except BaseException as e:
+            if self.error is None:
+                self.error = StageError(f"pipeline stage {stage.name!r} failed: {e!r}")
+                self.error.__cause__ = e
+            self._stop.set()
+        finally:
+            close = getattr(outputs, "close", None)
+            if close is not None:
+                close()  # run the stage's cleanup (temp files, pools) in its own thread
+            with stage._lock:
+                stage.running -= 1
+                last = stage.running == 0
+            if last:
+                self._put(stage.output, _DONE)
+
+    def start(self):
+        self.started = time.monotonic()
+        upstream = None
+        for stage in self.stages:
+            # count every worker as running before any of them can finish
+            stage.running = stage.workers
+            for n in range(stage.workers):
+                inputs = self._drain(upstream.output) if upstream is not None else None
+                thread = threading.Thread(target=self._work, args=(stage, inputs),
+                                          name=f"{stage.name}-{n}", daemon=True)
+                self._threads.append(thread)
+            upstream = stage
+        for thread in self._threads:
+            thread.start()
+        if self.report_every:
+            threading.Thread(target=self._report, name="pipeline-report", daemon=True).start()
+        return self
+
+    def __iter__(self):
+        if self.started is None:
+            self.start()
+        yield from self._drain(self.stages[-1].output)
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """Stop every stage (e.g. after the sender stopped early) and wait for their threads."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def metrics(self):
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        metrics = {}
+        for stage in self.stages:
+            m = stage.metrics()
+            m["items_per_second"] = m["items_out"] / elapsed if elapsed else 0.0
+            metrics[stage.name] = m
+        return metrics
+
+    def summary(self):
+        return " | ".join(
+            f"{name} x{m['workers']}: {m['items_out']} out ({m['items_per_second']:.0f}/s), "
+            f"queue {m['queue_depth']}/{m['queue_size']}"
+            for name, m in self.metrics().items()
+        )
+
+    def _report(self):
+        while not self._stop.wait(self.report_every):
+            print(f"[pipeline] {self.summary()}")
+            if all(not t.is_alive() for t in self._threads):
+                return
+
+
+class Sink:
+    """A last stage fed with put(); `fn(item)` runs in `workers` background threads."""
+
+    def __init__(self, name, fn, workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue = queue.Queue(queue_size)
+        self.items_in = 0
+        self.error = None
+        self._threads = [threading.Thread(target=self._work, name=f"{name}-{n}", daemon=True)
+                         for n in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, item):
+        self.queue.put(item)
+        self.items_in += 1
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            try:
+                self.fn(item)
+            except Exception as e:
+                # keep draining so put() never blocks on a dead sink; close() re-raises
+                if self.error is None:
+                    self.error = e
+
+    def close(self):
+        """Process everything already put, then stop the workers."""
+        for _ in self._threads:
+            self.queue.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+        if self.error is not None:
+            raise StageError(f"{self.name} failed: {self.error!r}") from self.error
+
+    def metrics(self):
+        return {"workers": self.workers, "items_in": self.items_in,
+                "queue_depth": self.queue.qsize(), "queue_size": self.queue.maxsize}
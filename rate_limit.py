@@ -0,0 +1,302 @@
+"""
+Gmail quota-unit rate limiting.
+
+Gmail meters each user in quota units per second (messages.send costs 100 units)
+and separately caps how many messages an account may send in a rolling day. RateLimiter
+models both with a token bucket that only blocks when the bucket is empty;
+ConcurrencyController adapts how many sends are in flight from 429/403 feedback.
+"""
+
+import asyncio
+import collections
+import threading
+import time
+
+GMAIL_UNITS_PER_SECOND = 250  # per-user limit (15,000 units per minute)
+SEND_QUOTA_UNITS = 100  # cost of users.messages.send
+DAY_SECONDS = 24 * 60 * 60
+SETTLE_POLL_SECONDS = 0.05  # how often a reservation blocked on pending sends re-checks the daily cap
+
+
+class DailyLimitReached(Exception):
+    pass
+
+
+def _throttle_histogram(metrics, kind):
+    if metrics is None:
+        return None
+    return metrics.histogram("throttle_seconds", "Time sends spent waiting on rate or concurrency limits",
+                             kind=kind)
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket measured in Gmail quota units, plus a rolling
+    24-hour cap on delivered messages.
+
+    Callers reserve units up front and then wait off the lock, so serial,
+    threaded and asyncio senders can share one instance. Only successful
+    sends count towards the daily cap: each reservation is held as pending
+    until settle() reports its outcome, and a new reservation that could push
+    delivered + pending over the cap waits for pending sends to settle first.
+    `sent_times` seeds the window with earlier sends (epoch seconds, e.g. from
+    the contact history) so reruns on the same day share one budget.
+    """
+
+    def __init__(self, units_per_second=GMAIL_UNITS_PER_SECOND, burst=None, daily_limit=0, clock=time.monotonic,
+                 metrics=None, sent_times=()):
+        self.rate = float(units_per_second)
+        self.capacity = float(burst if burst is not None else units_per_second)
+        self.daily_limit = daily_limit
+        self.clock = clock
+
+        self._cond = threading.Condition()
+        self._tokens = self.capacity
+        self._updated = clock()
+        # clock() times of delivered sends in the last day; at most daily_limit of them
+        offset = self._updated - time.time()
+        self._sent = collections.deque(sorted(t + offset for t in sent_times) if daily_limit else ())
+        self._pending = 0
+        self._exhausted = None
+        self.sent_count = 0
+
+        self.throttled_seconds = 0.0
+        self.throttled_count = 0
+        self._waits = _throttle_histogram(metrics, "rate_limit")
+
+    @property
+    def sent_today(self):
+        with self._cond:
+            self._expire(self.clock())
+            return len(self._sent)
+
+    def _expire(self, now):
+        while self._sent and self._sent[0] <= now - DAY_SECONDS:
+            self._sent.popleft()
+
+    def _reserve(self, units, sends):
+        # returns the wait in seconds, or None while pending sends could still use up the daily cap
+        with self._cond:
+            now = self.clock()
+            if self._exhausted is not None:
+                raise DailyLimitReached(self._exhausted)
+            if self.daily_limit:
+                self._expire(now)
+                if len(self._sent) + sends > self.daily_limit:
+                    raise DailyLimitReached(
+                        f"daily sending limit of {self.daily_limit} reached ({len(self._sent)} sent in the last 24h)"
+                    )
+                if len(self._sent) + self._pending + sends > self.daily_limit:
+                    return None
+
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= units
+            self._pending += sends
+
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait:
+                self.throttled_seconds += wait
+                self.throttled_count += 1
+            return wait
+
+    def acquire(self, units=SEND_QUOTA_UNITS, sends=1):
+        while True:
+            wait = self._reserve(units, sends)
+            if wait is not None:
+                break
+            with self._cond:
+                self._cond.wait(SETTLE_POLL_SECONDS)
+        if wait:
+            if self._waits is not None:
+                self._waits.record(wait)
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, units=SEND_QUOTA_UNITS, sends=1):
+        while True:
+            wait = self._reserve(units, sends)
+            if wait is not None:
+                break
+            await asyncio.sleep(SETTLE_POLL_SECONDS)
+        if wait:
+            if self._waits is not None:
+                self._waits.record(wait)
+            await asyncio.sleep(wait)
+        return wait
+
+    def remaining_today(self):
+        """Sends the daily cap still allows beyond those pending; None without a cap."""
+        if not self.daily_limit:
+            return None
+        with self._cond:
+            self._expire(self.clock())
+            return max(0, self.daily_limit - len(self._sent) - self._pending)
+
+    def exhaust(self, reason):
+        """Gmail itself reported the daily cap reached: every later reservation raises DailyLimitReached."""
+        with self._cond:
+            self._exhausted = reason
+            self._cond.notify_all()
+
+    def settle(self, sent):
+        """Report the outcome of one reserved send; only delivered ones count towards the daily cap."""
+        with self._cond:
+            self._pending -= 1
+            if sent:
+                self.sent_count += 1
+                if self.daily_limit:
+                    self._sent.append(self.clock())
+            self._cond.notify_all()
+
+    def summary(self):
+        counted = f", {self.sent_today} of {self.daily_limit} daily sends used" if self.daily_limit else ""
+        return f"throttled {self.throttled_count} times for {self.throttled_seconds:.1f}s{counted}"
+
+
+THROTTLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+def error_reasons(error):
+    details = getattr(error, "error_details", None)
+    if not isinstance(details, list):
+        return set()
+    return {d.get("reason") for d in details if isinstance(d, dict)}
+
+
+def rate_limit_signal(error):
+    """
+    Return the Retry-After delay in seconds (0.0 when absent) if `error` is a
+    Gmail rate-limit response (429, or 403 with a rate-limit reason), else None.
+    """
+    resp = getattr(error, "resp", None)
+    status = getattr(resp, "status", None)
+    if status != 429 and not (status == 403 and error_reasons(error) & THROTTLE_REASONS):
+        return None
+    try:
+        return max(0.0, float(resp.get("retry-after", 0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ConcurrencyController:
+    """
+    AIMD limit on in-flight sends.
+
+    Every success grows the window by `increase / window` (about +increase per
+    round trip of sends); a rate-limit response multiplies it by `decrease` at
+    most once per cooldown and pauses new sends for the Retry-After delay.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, increase=1.0, decrease=0.5,
+                 cooldown=1.0, clock=time.monotonic, metrics=None):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._next_decrease = 0.0
+
+        self.throttle_events = 0
+        self.peak_limit = self.limit
+        self._slot_waits = _throttle_histogram(metrics, "concurrency")
+        self._pauses = _throttle_histogram(metrics, "backoff")
+
+    @property
+    def window(self):
+        return max(self.min_limit, int(self.limit))
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def pause_remaining(self):
+        return max(0.0, self._paused_until - self.clock())
+
+    def _try_acquire(self):
+        # Called with the condition held. Returns 0 when a slot was taken,
+        # otherwise how long to wait (None = until a slot is released).
+        pause = self.pause_remaining()
+        if pause:
+            return pause
+        if self._in_flight >= self.window:
+            return None
+        self._in_flight += 1
+        return 0
+
+    def _record_wait(self, started):
+        if started is not None and self._slot_waits is not None:
+            self._slot_waits.record(time.monotonic() - started)
+
+    def acquire(self):
+        started = None
+        with self._cond:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0:
+                    break
+                started = started or time.monotonic()
+                self._cond.wait(wait)
+        self._record_wait(started)
+
+    async def acquire_async(self, poll=0.01):
+        started = None
+        while True:
+            with self._cond:
+                wait = self._try_acquire()
+            if wait == 0:
+                break
+            started = started or time.monotonic()
+            await asyncio.sleep(wait or poll)
+        self._record_wait(started)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def wait_ready(self):
+        pause = self.pause_remaining()
+        if pause:
+            if self._pauses is not None:
+                self._pauses.record(pause)
+            time.sleep(pause)
+
+    def on_success(self):
+        with self._cond:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after=0.0):
+        with self._cond:
+            now = self.clock()
+            self.throttle_events += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            # many in-flight sends fail together on one overload; only react once
+            if now >= self._next_decrease:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._next_decrease = now + max(self.cooldown, retry_after)
+
+    def record(self, error=None):
+        """Feed one send outcome (None = success); returns the rate-limit signal."""
+        if error is None:
+            self.on_success()
+            return None
+        signal = rate_limit_signal(error)
+        if signal is not None:
+            self.on_throttle(signal)
+        return signal
+
+    def summary(self):
+        return (
+            f"window {self.window} (peak {self.peak_limit:.0f}), "
+            f"{self.throttle_events} rate-limit responses"
+        )
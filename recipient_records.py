@@ -0,0 +1,145 @@
+"""
+Structured recipient lists: CSV, TSV and JSON Lines, optionally gzip-compressed.
+
+Rows are streamed one at a time. Each row with a usable address becomes a
+Recipient: a str holding the normalized address (so de-duplication,
+suppression, the journal and the senders treat it like any other address)
+with the whole row attached as `fields` for message personalization.
+"""
+
+import csv
+import gzip
+import json
+import pickle
+import tempfile
+from pathlib import Path
+
+from external_dedupe import Dedupe
+from recipients import extract_email, parallel_iter_emails
+
+FORMATS = {".csv": "csv", ".tsv": "tsv", ".tab": "tsv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+EMAIL_COLUMNS = ("email", "e-mail", "email_address", "email address", "mail", "to")
+
+
+class Recipient(str):
+    """A normalized address carrying its row's merge fields."""
+
+    fields: dict
+
+    def __new__(cls, address, fields):
+        self = super().__new__(cls, address)
+        self.fields = fields
+        return self
+
+    def __reduce__(self):
+        # keep the fields when records are pickled into worker processes
+        return type(self), (str(self), self.fields)
+
+
+def detect_format(path: Path):
+    """'csv', 'tsv' or 'jsonl' from the file extension (ignoring a trailing .gz), else None for free text."""
+    suffixes = [s.lower() for s in Path(path).suffixes]
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes.pop()
+    return FORMATS.get(suffixes[-1]) if suffixes else None
+
+
+def _open_text(path: Path):
+    # utf-8-sig drops the byte-order mark spreadsheet exports often start with; bytes from
+    # other encodings (e.g. a cp1252 Excel export) become U+FFFD instead of stopping the load
+    if path.suffix.lower() == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8-sig", errors="replace", newline="")
+    return path.open(encoding="utf-8-sig", errors="replace", newline="")
+
+
+def _email_key(keys):
+    by_name = {str(k).strip().lower(): k for k in keys}
+    for name in EMAIL_COLUMNS:
+        if name in by_name:
+            return by_name[name]
+    return None
+
+
+def iter_rows(path: Path, fmt=None):
+    """Yield each row of a structured list as a dict of field name -> value."""
+    path = Path(path)
+    fmt = fmt or detect_format(path)
+    with _open_text(path) as f:
+        if fmt == "jsonl":
+            skipped = 0
+            for line in f:
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    if isinstance(row, dict):
+                        yield row
+                    else:
+                        skipped += 1
+            if skipped:
+                print(f"{path}: skipped {skipped} lines that are not JSON objects.")
+        elif fmt in ("csv", "tsv"):
+            yield from csv.DictReader(f, delimiter="\t" if fmt == "tsv" else ",")
+        else:
+            raise ValueError(f"unsupported recipient list format: {path}")
+
+
+def iter_records(path: Path, fmt=None, max_in_memory=None):
+    """
+    Yield a Recipient per row with an address, de-duplicated by address in
+    first-seen order. The address comes from an "email"-like column, or else
+    the first field whose value contains one.
+
+    With `max_in_memory`, addresses past that many are de-duplicated on disk
+    (see external_dedupe) and their rows wait in a temp file in the order they
+    were spilled. The unique spilled addresses come back in that same order,
+    so one forward pass over the file finds each one's first row.
+    """
+    dedupe = Dedupe(max_in_memory)
+    spilled_rows = None
+    try:
+        email_key = None
+        for row in iter_rows(path, fmt):
+            if email_key is None or email_key not in row:
+                email_key = _email_key(row)
+            values = [row.get(email_key)] if email_key is not None else row.values()
+            address = ""
+            for value in values:
+                address = extract_email(str(value)).strip("<>") if value else ""
+                if address:
+                    break
+            if not address or address in dedupe.seen:
+                continue
+            if dedupe.add((address,)):
+                yield Recipient(address, row)
+            else:
+                if spilled_rows is None:
+                    spilled_rows = tempfile.TemporaryFile(prefix="recipient-rows-")
+                pickle.dump((address, row), spilled_rows, pickle.HIGHEST_PROTOCOL)
+
+        if spilled_rows is not None:
+            spilled_rows.seek(0)
+            for address in dedupe.finish():
+                spilled, row = pickle.load(spilled_rows)
+                while spilled != address:
+                    spilled, row = pickle.load(spilled_rows)
+                yield Recipient(address, row)
+    finally:
+        dedupe.close()
+        if spilled_rows is not None:
+            spilled_rows.close()
+
+
+def iter_recipients(path: Path, workers=None, max_in_memory=None):
+    """
+    Stream recipients from any supported list: Recipient records for structured
+    files, plain addresses for text. `workers` only applies to free text;
+    structured lists are read by one process, since quoted CSV fields may span
+    lines and gzip streams cannot be split at byte offsets.
+    """
+    path = Path(path)
+    fmt = detect_format(path)
+    if fmt is None:
+        return parallel_iter_emails(path, workers, max_in_memory=max_in_memory)
+    return iter_records(path, fmt, max_in_memory=max_in_memory)
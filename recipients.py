@@ -0,0 +1,152 @@
+"""
+Recipient list parsing.
+
+Each line of the list contributes at most one address: its last
+whitespace-separated token with an "@" and a "." somewhere after the first "@",
+stripped of surrounding commas/semicolons and lower-cased. Duplicates are
+dropped, keeping first-seen order.
+
+iter_emails() streams a list in one process; parallel_iter_emails() splits a
+memory-mapped list at line boundaries and parses the pieces in worker processes.
+"""
+
+import collections
+import itertools
+import mmap
+import operator
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from external_dedupe import Dedupe
+from pipeline import process_pool_context
+
+READ_CHUNK_BYTES = 1024 * 1024
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024  # below this, process start-up costs more than it saves
+PARALLEL_SLICE_BYTES = 16 * 1024 * 1024
+
+# Matching runs over the *reversed* chunk, so a line's address is the first
+# matching token after each "\n" and every match starts on a literal newline,
+# which re can scan for quickly. The first alternative is the common single-"@"
+# address; each of its runs excludes the character that ends it, so it cannot
+# backtrack far. The lazy token skip only kicks in when a line's last token is
+# not an address.
+REVERSED_EMAIL = re.compile(r"\n[^\S\n]*(?:\S+[^\S\n]+)*?([^\s@.]*\.[^\s@]*@[^\s@]*|\S*\.\S*@[^\s@]*)(?!\S)")
+# the other line boundaries of str.splitlines() (text-mode reads already turn \r and \r\n into \n);
+# pdftotext output, for one, separates pages with \f
+LINE_BREAKS = "\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+_reverse = operator.itemgetter(slice(None, None, -1))
+_strip = operator.methodcaller("strip", ",;")
+
+
+def extract_email(line: str):
+    found = scan_reversed(line)
+    return found[0][::-1] if found else ""
+
+
+def scan_reversed(text: str):
+    """Return the address of every line in `text`, in order, each spelled backwards."""
+    for sep in LINE_BREAKS:
+        text = text.replace(sep, "\n")
+    found = REVERSED_EMAIL.findall((text + "\n").lower()[::-1])
+    found.reverse()
+    return list(map(_strip, found))
+
+
+def iter_emails(path: Path, chunk_size=READ_CHUNK_BYTES, max_in_memory=None):
+    """
+    Yield normalized, de-duplicated addresses while reading the file in chunks.
+    With `max_in_memory`, de-duplication spills to disk past that many addresses;
+    those later addresses are then yielded once the whole file has been read.
+    """
+    dedupe = Dedupe(max_in_memory)  # holds reversed addresses, as scan_reversed() returns them
+    tail = ""
+    try:
+        with path.open(encoding="utf-8", errors="ignore") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                # only scan whole lines; the partial last line waits for the next chunk
+                text, _, tail = (tail + chunk).rpartition("\n")
+                yield from map(_reverse, dedupe.add(scan_reversed(text)))
+        yield from map(_reverse, dedupe.add(scan_reversed(tail)))
+        yield from map(_reverse, dedupe.finish())
+    finally:
+        dedupe.close()
+
+
+def load_emails(path: Path):
+    return list(iter_emails(path))
+
+
+def _parse_range(path, start, end, chunk_size=PARALLEL_SLICE_BYTES):
+    # worker process: scan bytes [start, end) of the list, which begin and end on line boundaries
+    found = {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            cut = min(end, pos + chunk_size)
+            if cut < end:
+                nl = mm.find(b"\n", cut, end)
+                cut = end if nl < 0 else nl + 1
+            text = mm[pos:cut].decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+            found.update(dict.fromkeys(scan_reversed(text)))
+            pos = cut
+    return list(found)
+
+
+def line_aligned_ranges(mm, parts):
+    """Split a mapped file into up to `parts` [start, end) ranges that each end after a newline."""
+    size = len(mm)
+    bounds = [0]
+    for k in range(1, parts):
+        nl = mm.find(b"\n", max(bounds[-1], size * k // parts))
+        if nl < 0:
+            break
+        bounds.append(nl + 1)
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+
+def parallel_iter_emails(path: Path, workers=None, min_bytes=PARALLEL_MIN_BYTES, max_in_memory=None):
+    """
+    Like iter_emails(), but memory-maps the file and parses line-aligned ranges
+    in worker processes. Results are merged in file order, so the output is
+    identical. Small files are parsed in-process.
+
+    Only workers + 1 ranges are in flight at a time, so parsed ranges never
+    pile up ahead of a slow consumer, and closing the generator early cancels
+    the ranges that have not started.
+    """
+    path = Path(path)
+    workers = workers or os.cpu_count() or 1
+    size = path.stat().st_size
+    if workers < 2 or size < min_bytes:
+        yield from iter_emails(path, max_in_memory=max_in_memory)
+        return
+
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # a few ranges per worker keeps all cores busy when some ranges are denser;
+        # capping their size bounds what each finished range holds in memory
+        ranges = iter(line_aligned_ranges(mm, max(workers * 4, -(-size // PARALLEL_SLICE_BYTES))))
+
+    dedupe = Dedupe(max_in_memory)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context())
+    window = collections.deque()
+    try:
+        for start, end in itertools.islice(ranges, workers + 1):
+            window.append(pool.submit(_parse_range, str(path), start, end))
+        while window:
+            found = window.popleft().result()
+            for start, end in itertools.islice(ranges, 1):
+                window.append(pool.submit(_parse_range, str(path), start, end))
+            yield from map(_reverse, dedupe.add(found))
+        yield from map(_reverse, dedupe.finish())
+    finally:
+        for future in window:
+            future.cancel()
+        pool.shutdown()
+        dedupe.close()
+
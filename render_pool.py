@@ -0,0 +1,114 @@
+"""
+Message rendering in worker processes.
+
+Personalized messages are rendered (templates, MIME text part, base64) in a
+process pool while the sending thread keeps the network busy. Workers only
+compute each recipient's head (MessageTemplate.payload_head()); the shared,
+already-encoded attachment tail is joined on in this process, so only a few
+hundred bytes per recipient cross the process boundary.
+
+Chunks of recipients are submitted in list order by a feeder thread, and
+their futures pass through a bounded queue: rendering runs at most
+`max_chunks` chunks ahead of the sender.
+"""
+
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from message_template import MessageTemplate
+from pipeline import process_pool_context
+from send_session import SendSession
+
+RENDER_CHUNK = 64  # recipients per worker task; amortizes inter-process overhead
+MAX_CHUNKS_AHEAD = 4  # per worker
+
+_template = None
+
+
+def _init_worker(template: MessageTemplate):
+    global _template
+    _template = template
+
+
+def _render_chunk(chunk):
+    # worker process: (i, to_email) pairs -> (i, to_email, head, shares_tail, error, seconds)
+    rendered = []
+    for i, to_email in chunk:
+        started = time.perf_counter()
+        try:
+            head, shared = _template.payload_head(to_email)
+        except Exception as e:
+            rendered.append((i, to_email, None, False, e, time.perf_counter() - started))
+        else:
+            rendered.append((i, to_email, head, shared, None, time.perf_counter() - started))
+    return rendered
+
+
+def render_jobs(numbered, template: MessageTemplate, session: SendSession, workers=None,
+                chunk_size=RENDER_CHUNK, max_chunks=None):
+    """
+    Like iter_jobs(): turn (index, to_email) pairs into (index, to_email,
+    payload) jobs, in order, with the payloads rendered in `workers`
+    processes. Recipients whose message cannot be rendered are reported
+    through session.fail().
+    """
+    workers = workers or os.cpu_count() or 1
+    latency = session.metrics.histogram("render_seconds")
+    pending = queue.Queue(maxsize=max_chunks or workers * MAX_CHUNKS_AHEAD)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed():
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context(),
+                                     initializer=_init_worker, initargs=(template,)) as pool:
+                numbered_iter = iter(numbered)
+                while not stop.is_set():
+                    chunk = list(itertools.islice(numbered_iter, chunk_size))
+                    if not chunk:
+                        break
+                    if not put(pool.submit(_render_chunk, chunk)):
+                        break
+                if stop.is_set():
+                    # the sender stopped early; drop chunks that have not started
+                    while True:
+                        try:
+                            pending.get_nowait().cancel()
+                        except queue.Empty:
+                            break
+        except BaseException as e:
+            put(e)
+        finally:
+            put(done)
+
+    feeder = threading.Thread(target=feed, name="render-feeder", daemon=True)
+    feeder.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            for i, to_email, head, shared, error, seconds in item.result():
+                latency.record(seconds)
+                if error is not None:
+                    session.fail(i, to_email, error)
+                else:
+                    yield i, to_email, template.join_payload(head, shared)
+    finally:
+        stop.set()
+        feeder.join()
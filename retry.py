@@ -0,0 +1,153 @@
+"""
+Retry scheduling for failed sends.
+
+Errors are classified as retryable (transient server/network trouble, short
+backoff), retry-later (rate or quota limits, long backoff honouring
+Retry-After), daily-limit (the account's sending cap; never retried, the run
+stops) or permanent. Retries wait in a heap ordered by due time so they
+interleave with fresh sends; recipients that cannot be sent go to a dead-letter
+file whose lines load_emails() can read back in.
+"""
+
+import heapq
+import itertools
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httplib2
+from google.auth.exceptions import TransportError
+
+from rate_limit import error_reasons, rate_limit_signal
+
+RETRYABLE = "retryable"
+RETRY_LATER = "retry-later"
+DAILY_LIMIT = "daily-limit"
+PERMANENT = "permanent"
+
+TRANSIENT_STATUS = {500, 502, 503, 504}
+TRANSIENT_REASONS = {"backendError", "internalError"}
+LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+DAILY_LIMIT_REASONS = {"dailyLimitExceeded"}
+
+
+def classify(error):
+    # httplib2 and google-auth raise their own types for DNS and connection failures
+    if isinstance(error, (socket.timeout, TimeoutError, ConnectionError, httplib2.HttpLib2Error, TransportError)):
+        return RETRYABLE
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is None:
+        return PERMANENT
+    status = int(status)
+    reasons = error_reasons(error)
+    if status in (403, 429) and reasons & DAILY_LIMIT_REASONS:
+        return DAILY_LIMIT
+    if status in TRANSIENT_STATUS or reasons & TRANSIENT_REASONS:
+        return RETRYABLE
+    if status == 429 or (status == 403 and reasons & LIMIT_REASONS):
+        return RETRY_LATER
+    return PERMANENT
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: uniform(0, min(cap, base * 2**attempt))."""
+
+    def __init__(self, base, cap, max_attempts):
+        self.base = base
+        self.cap = cap
+        self.max_attempts = max_attempts
+
+    def delay(self, attempt, rng=random):
+        return rng.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+DEFAULT_POLICIES = {
+    RETRYABLE: RetryPolicy(base=1.0, cap=60.0, max_attempts=5),
+    RETRY_LATER: RetryPolicy(base=30.0, cap=3600.0, max_attempts=8),
+}
+
+
+class RetryQueue:
+    """Delay-ordered retry heap; safe to share between sender threads."""
+
+    def __init__(self, policies=None, clock=time.monotonic, rng=None):
+        self.policies = policies or DEFAULT_POLICIES
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._heap = []
+        self._seq = itertools.count()
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def attempts(self, key):
+        return self._attempts.get(key, 0)
+
+    def forget(self, key):
+        """Drop the attempt count of a job that succeeded, so the map only holds jobs still retrying."""
+        with self._lock:
+            self._attempts.pop(key, None)
+
+    def schedule(self, key, item, error):
+        """
+        Queue `item` for another attempt. Returns the delay in seconds, or None
+        when the error is permanent or the class's attempt budget is spent.
+        """
+        policy = self.policies.get(classify(error))
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            if policy is None or attempt >= policy.max_attempts:
+                self._attempts.pop(key, None)
+                return None
+
+            self._attempts[key] = attempt + 1
+            delay = max(policy.delay(attempt, self.rng), rate_limit_signal(error) or 0.0)
+            heapq.heappush(self._heap, (self.clock() + delay, next(self._seq), item))
+        return delay
+
+    def drain(self):
+        """Remove and return every queued item, due or not (the run is stopping)."""
+        with self._lock:
+            items = [item for _, _, item in self._heap]
+            self._heap.clear()
+            self._attempts.clear()
+        return items
+
+    def pop_ready(self, limit):
+        now = self.clock()
+        ready = []
+        with self._lock:
+            while self._heap and len(ready) < limit and self._heap[0][0] <= now:
+                ready.append(heapq.heappop(self._heap)[2])
+        return ready
+
+    def next_delay(self):
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - self.clock())
+
+
+class DeadLetterFile:
+    """
+    Append-only record of recipients given up on. The address is the last
+    token on each line, so the file can be used as EMAIL_LIST_FILE to re-send.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, to_email, error):
+        status = getattr(getattr(error, "resp", None), "status", "-")
+        reason = " ".join(str(error).split()).replace("@", "(at)")
+        stamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        with self._lock, self.path.open("a", encoding="utf-8") as f:
+            f.write(f"{stamp} {classify(error)} {status} {reason} {to_email}\n")
+            self.count += 1
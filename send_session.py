@@ -0,0 +1,168 @@
+"""
+Shared bookkeeping for one sending run: rate limiting, concurrency feedback,
+retries, the send journal, the contact history and the final tally. Every send mode reports
+outcomes through SendSession.record() so they all behave the same way on errors.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+
+from metrics import Metrics
+from rate_limit import RateLimiter, ConcurrencyController, SEND_QUOTA_UNITS, error_reasons
+from retry import RetryQueue, DeadLetterFile, classify, DAILY_LIMIT
+from journal import SendJournal, SENT, FAILED
+from contact_history import ContactHistory
+
+
+class SendSession:
+    def __init__(self, limiter: RateLimiter, controller: ConcurrencyController,
+                 retry_queue: RetryQueue, dead_letter: DeadLetterFile, journal: SendJournal = None,
+                 history: ContactHistory = None, recorder=None, metrics: Metrics = None):
+        self.limiter = limiter
+        self.controller = controller
+        self.retry_queue = retry_queue
+        self.dead_letter = dead_letter
+        self.journal = journal
+        self.history = history
+        # optional pipeline.Sink running store() off the send path; None = write inline
+        self.recorder = recorder
+        # latency histograms and outcome/error counters; the senders record into it too
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.describe("render_seconds", "Time to render one recipient's message payload")
+        self.metrics.describe("send_seconds", "Duration of one Gmail API HTTP request, by send mode")
+        self.metrics.describe("token_refresh_seconds", "Duration of OAuth access token refreshes")
+        self.metrics.describe("sends_total", "Send attempts by outcome")
+        self.metrics.describe("errors_total", "Failed send attempts by HTTP status and Gmail error reason")
+        self.sent = 0
+        self.failed = 0
+        self._count_lock = threading.Lock()  # record() runs in several threads in threads mode
+        # jobs Gmail refused with dailyLimitExceeded; only ever the few that were in flight
+        self.unsent = []
+
+    def next_jobs(self, fresh, size):
+        """Take up to `size` jobs, due retries first, then fresh (index, to_email, message) jobs."""
+        jobs = self.retry_queue.pop_ready(size)
+        jobs.extend(self.take_fresh(fresh, size - len(jobs)))
+        return jobs
+
+    def take_fresh(self, fresh, size):
+        """Take up to `size` fresh jobs. Send them only after admit()."""
+        return list(itertools.islice(fresh, size))
+
+    def admit(self, jobs):
+        """
+        Reserve send quota for `jobs`, then mark them queued in the journal.
+        Marking comes last so that jobs stopped by DailyLimitReached are never
+        left in doubt.
+        """
+        try:
+            self.limiter.acquire(SEND_QUOTA_UNITS * len(jobs), sends=len(jobs))
+        except BaseException:
+            self.abandon(jobs)
+            raise
+        self.mark_queued(jobs)
+
+    async def admit_async(self, jobs):
+        try:
+            await self.limiter.acquire_async(SEND_QUOTA_UNITS * len(jobs), sends=len(jobs))
+        except BaseException:
+            self.abandon(jobs)
+            raise
+        # the journal commit is disk I/O; keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.mark_queued, jobs)
+
+    def mark_queued(self, jobs):
+        if jobs and self.journal is not None:
+            self.journal.mark_queued(to_email for _, to_email, _ in jobs)
+
+    def abandon(self, jobs):
+        """Jobs that will not be sent this run: clear their queued state so a rerun sends them."""
+        if jobs and self.journal is not None:
+            self.journal.unqueue(to_email for _, to_email, _ in jobs)
+
+    def release_unsent(self):
+        """At the end of a run, abandon the jobs refused by the daily limit and any still awaiting a retry."""
+        unsent = self.unsent + self.retry_queue.drain()
+        self.unsent = []
+        self.abandon(unsent)
+        return len(unsent)
+
+    def wait_for_retries(self):
+        """Sleep until the next retry is due. Returns False when none are queued."""
+        delay = self.retry_queue.next_delay()
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+
+    def record(self, job, response, error):
+        i, to_email, _ = job
+        self.limiter.settle(error is None)
+        self.controller.record(error)
+        if error is None:
+            self.metrics.count("sends_total", outcome="sent")
+            self.retry_queue.forget(i)
+            message_id = (response or {}).get("id")
+            with self._count_lock:
+                self.sent += 1
+            self._persist((SENT, to_email, message_id))
+            print(f"[{i}] SENT -> {to_email}")
+            return
+
+        self.count_error(error)
+        if classify(error) == DAILY_LIMIT:
+            # retrying for hours cannot help; stop the run and leave the recipient for the next one
+            status = getattr(getattr(error, "resp", None), "status", "-")
+            self.limiter.exhaust(f"Gmail reports the daily sending limit reached (HTTP {status} dailyLimitExceeded)")
+            self.retry_queue.forget(i)
+            self.unsent.append(job)
+            self.metrics.count("sends_total", outcome="unsent")
+            print(f"[{i}] NOT SENT (daily limit) -> {to_email}")
+            return
+
+        delay = self.retry_queue.schedule(i, job, error)
+        if delay is not None:
+            self.metrics.count("sends_total", outcome="retry")
+            print(f"[{i}] RETRY in {delay:.1f}s -> {to_email} | {error}")
+            return
+
+        self.metrics.count("sends_total", outcome="failed")
+        with self._count_lock:
+            self.failed += 1
+        self.dead_letter.add(to_email, error)
+        self._persist((FAILED, to_email, error))
+        print(f"[{i}] FAIL -> {to_email} | Gmail API error: {error}")
+
+    def fail(self, i, to_email, error):
+        """Record a recipient that never reached Gmail (e.g. the message could not be built)."""
+        self.metrics.count("sends_total", outcome="not_sent")
+        with self._count_lock:
+            self.failed += 1
+        self.dead_letter.add(to_email, error)
+        self._persist((FAILED, to_email, error))
+        print(f"[{i}] FAIL -> {to_email} | {error}")
+
+    def count_error(self, error):
+        status = getattr(getattr(error, "resp", None), "status", None)
+        reasons = error_reasons(error) - {None} or {type(error).__name__}
+        for reason in reasons:
+            self.metrics.count("errors_total", status=status or "none", reason=reason)
+
+    def _persist(self, outcome):
+        if self.recorder is not None:
+            self.recorder.put(outcome)
+        else:
+            self.store(outcome)
+
+    def store(self, outcome):
+        """Write one (state, to_email, message_id or error) outcome to the journal and contact history."""
+        state, to_email, detail = outcome
+        if state == SENT:
+            if self.journal is not None:
+                self.journal.mark_sent(to_email, detail)
+            if self.history is not None:
+                self.history.record(to_email)
+        elif self.journal is not None:
+            self.journal.mark_failed(to_email, detail)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Persistent suppression list: addresses that must never be emailed again
+(unsubscribes, hard bounces, people already contacted).
+
+The list is an on-disk open-addressing hash table of 64-bit address
+fingerprints, memory-mapped so a lookup touches one or two slots no matter how
+big it is. An optional Bloom filter stored in the same file is read into memory
+and answers most "not suppressed" lookups without touching the table; it pays
+off when the table is larger than the page cache (for a warm table the extra
+bit tests cost more in Python than the probe they save).
+
+    python suppression.py add bounces.txt unsubscribes.txt
+    python suppression.py check someone@example.com
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from recipients import iter_emails
+
+MAGIC = b"GMSUPP1\0"
+HEADER = struct.Struct("<8sQQQ")  # magic, capacity (slots), count, bloom bytes
+SLOT = struct.Struct("<Q")
+MAX_LOAD = 0.5
+BLOOM_HASHES = 4
+BLOOM_BITS_PER_SLOT = 4  # 8+ bits per stored address at MAX_LOAD: ~2% false positives
+
+
+def fingerprint(address: str):
+    fp = int.from_bytes(hashlib.blake2b(address.encode("utf-8"), digest_size=8).digest(), "little")
+    return fp or 1  # 0 marks an empty slot
+
+
+def normalize(address: str):
+    return address.strip().strip("<>,;").lower()
+
+
+class SuppressionList:
+    def __init__(self, path: Path, initial_capacity=1 << 16, bloom=False):
+        self.path = Path(path)
+        if not self.path.exists():
+            self._create(self.path, initial_capacity, bloom)
+        self._open()
+
+    @staticmethod
+    def _create(path, capacity, bloom):
+        bloom_bytes = capacity * BLOOM_BITS_PER_SLOT // 8 if bloom else 0
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, capacity, 0, bloom_bytes))
+            f.truncate(HEADER.size + capacity * SLOT.size + bloom_bytes)
+
+    def _open(self):
+        self._file = open(self.path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, self.count, bloom_bytes = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a suppression list")
+        self._bloom_offset = HEADER.size + self.capacity * SLOT.size
+        self._bloom = bytearray(self._mm[self._bloom_offset:self._bloom_offset + bloom_bytes])
+        self._bloom_bits = bloom_bytes * 8
+
+    def close(self):
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _bloom_positions(self, fp):
+        h1, h2 = fp & 0xFFFFFFFF, (fp >> 32) | 1
+        return [(h1 + i * h2) % self._bloom_bits for i in range(BLOOM_HASHES)]
+
+    def _find_slot(self, fp):
+        # returns (slot index, True if fp is stored there / False if the slot is empty)
+        mm, capacity = self._mm, self.capacity
+        i = fp % capacity
+        while True:
+            stored = SLOT.unpack_from(mm, HEADER.size + i * SLOT.size)[0]
+            if stored == fp:
+                return i, True
+            if stored == 0:
+                return i, False
+            i = (i + 1) % capacity
+
+    def contains_fingerprint(self, fp):
+        bits = self._bloom_bits
+        if bits:
+            # same positions as _bloom_positions(), inlined for the hot path
+            bloom, h1, h2 = self._bloom, fp & 0xFFFFFFFF, (fp >> 32) | 1
+            for i in range(BLOOM_HASHES):
+                pos = (h1 + i * h2) % bits
+                if not bloom[pos >> 3] >> (pos & 7) & 1:
+                    return False
+        return self._find_slot(fp)[1]
+
+    def __contains__(self, address):
+        return self.contains_fingerprint(fingerprint(normalize(address)))
+
+    def filter(self, addresses):
+        """Yield the addresses that are not suppressed, unchanged; each is looked up by its normalize() key."""
+        contains, blake2b, from_bytes = self.contains_fingerprint, hashlib.blake2b, int.from_bytes
+        for address in addresses:
+            # the free-text loader keeps "<jane@example.com>"; add_many() stored "jane@example.com"
+            key = normalize(address)
+            fp = from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+            if not contains(fp):
+                yield address
+
+    def add_many(self, addresses):
+        """Add addresses; returns how many were new. Grows the table as needed."""
+        fps = {fingerprint(normalize(a)) for a in addresses if a.strip()}
+        if (self.count + len(fps)) > self.capacity * MAX_LOAD:
+            self._grow(self.count + len(fps))
+        added = 0
+        for fp in fps:
+            added += self._insert(fp)
+        self.count += added
+        self._sync()
+        return added
+
+    def _sync(self):
+        HEADER.pack_into(self._mm, 0, MAGIC, self.capacity, self.count, len(self._bloom))
+        self._mm[self._bloom_offset:self._bloom_offset + len(self._bloom)] = self._bloom
+        self._mm.flush()
+
+    def add(self, address):
+        return self.add_many([address])
+
+    def _insert(self, fp):
+        i, present = self._find_slot(fp)
+        if present:
+            return 0
+        SLOT.pack_into(self._mm, HEADER.size + i * SLOT.size, fp)
+        if self._bloom_bits:
+            for pos in self._bloom_positions(fp):
+                self._bloom[pos >> 3] |= 1 << (pos & 7)
+        return 1
+
+    def _stored_fingerprints(self):
+        for (fp,) in struct.iter_unpack("<Q", self._mm[HEADER.size:self._bloom_offset]):
+            if fp:
+                yield fp
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while needed > capacity * MAX_LOAD:
+            capacity *= 2
+        # rebuild next to the old file and swap it in atomically
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        bigger = SuppressionList(tmp, initial_capacity=capacity, bloom=bool(self._bloom_bits))
+        for fp in self._stored_fingerprints():
+            bigger.count += bigger._insert(fp)
+        bigger._sync()
+        bigger.close()
+
+        self.close()
+        os.replace(tmp, self.path)
+        self._open()
+
+    def import_file(self, path: Path):
+        """Bulk-add every address found in a bounce/unsubscribe export (one per line, free text)."""
+        return self.add_many(iter_emails(Path(path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the suppression list.")
+    parser.add_argument("--file", default="suppression.idx", type=Path)
+    parser.add_argument("--bloom", action="store_true", help="add a Bloom filter when creating the file")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="add every address found in the given files")
+    add.add_argument("sources", nargs="+", type=Path)
+    check = sub.add_parser("check", help="report whether addresses are suppressed")
+    check.add_argument("addresses", nargs="+")
+    args = parser.parse_args()
+
+    with SuppressionList(args.file, bloom=args.bloom) as suppression:
+        if args.command == "add":
+            for source in args.sources:
+                print(f"{source}: {suppression.import_file(source)} new addresses")
+            print(f"{args.file}: {len(suppression)} suppressed addresses")
+        else:
+            for address in args.addresses:
+                print(f"{address}: {'SUPPRESSED' if address in suppression else 'ok'}")
+
+
+if __name__ == "__main__":
+    main()
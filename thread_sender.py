@@ -0,0 +1,89 @@
+"""
+Thread-pool send mode.
+
+httplib2 (under googleapiclient) is not thread-safe, so each worker thread
+lazily builds its own authorized transport and Gmail service from the shared
+Credentials. Token refresh goes through one lock so threads don't all refresh
+at once when the access token expires.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google_auth_httplib2
+import httplib2
+from googleapiclient.discovery import build
+from google.auth.transport.requests import Request
+
+from message_template import send_request
+from send_session import SendSession
+
+HTTP_TIMEOUT_SECONDS = 60
+
+
+class SharedCredentials:
+    def __init__(self, creds, refresh_latency=None):
+        self.creds = creds
+        self.refresh_latency = refresh_latency
+        self._lock = threading.Lock()
+
+    def ensure_valid(self):
+        if not self.creds.valid:
+            with self._lock:
+                if not self.creds.valid:
+                    started = time.perf_counter()
+                    self.creds.refresh(Request())
+                    if self.refresh_latency is not None:
+                        self.refresh_latency.record(time.perf_counter() - started)
+
+
+def send_threaded(creds, jobs, session: SendSession, workers, build_kwargs=None):
+    shared = SharedCredentials(creds, session.metrics.histogram("token_refresh_seconds"))
+    latency = session.metrics.histogram("send_seconds", mode="threads")
+    local = threading.local()
+    finished = threading.Event()
+
+    def service():
+        if not hasattr(local, "service"):
+            http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+            local.service = build("gmail", "v1", http=http, cache_discovery=False, **(build_kwargs or {}))
+        return local.service
+
+    def send(job):
+        try:
+            shared.ensure_valid()
+            request = send_request(service(), job[2])
+            started = time.perf_counter()
+            try:
+                response = request.execute()
+            finally:
+                latency.record(time.perf_counter() - started)
+        except Exception as e:
+            session.record(job, None, e)
+        else:
+            session.record(job, response, None)
+        finally:
+            # release only after record() so "nothing in flight" implies any retry is queued
+            session.controller.release()
+            finished.set()
+
+    fresh = iter(jobs)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gmail-send") as pool:
+        while True:
+            session.controller.acquire()
+            batch = session.next_jobs(fresh, 1)
+            if not batch:
+                session.controller.release()
+                if not session.controller.in_flight and not session.retry_queue:
+                    break
+                finished.wait(session.retry_queue.next_delay())
+                finished.clear()
+                continue
+
+            try:
+                session.admit(batch)
+            except BaseException:
+                session.controller.release()
+                raise
+            pool.submit(send, batch[0])
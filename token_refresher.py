@@ -0,0 +1,130 @@
+"""
+Background OAuth access-token refresh.
+
+Access tokens last about an hour. Left alone, the first send after expiry
+refreshes the token inline (and with parallel senders, several at once).
+TokenRefresher renews it from a background thread `lead` seconds before it
+expires, well before google-auth would consider it stale, so the senders
+always find valid credentials and never wait on the token endpoint. The
+refresh runs on a copy of the credentials; only the new token and expiry are
+then written to the shared object. The old token is still valid at that
+point, so a sender reading the pair mid-swap still gets a usable token.
+Each new token is saved to token.json by writing a temp file and renaming it
+over the old one.
+
+The inline refresh in the senders stays as a fallback for when the
+background refresh keeps failing (e.g. the network is down for longer than
+`lead`).
+"""
+
+import copy
+import datetime
+import os
+import threading
+import time
+from pathlib import Path
+
+from google.auth.transport.requests import Request
+
+REFRESH_LEAD_SECONDS = 600  # must exceed google-auth's own 3m45s refresh threshold
+RETRY_SECONDS = 30  # after a failed refresh; the old token is usually still valid
+
+
+def save_token(creds, path: Path):
+    """Write creds to `path` atomically: readers see the old file or the new one, never half of it."""
+    tmp = path.with_name(path.name + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)  # holds a refresh token
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(creds.to_json())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _utcnow():
+    # google-auth keeps expiry as a naive UTC datetime
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class TokenRefresher:
+    def __init__(self, creds, token_path: Path = None, lead=REFRESH_LEAD_SECONDS, retry=RETRY_SECONDS,
+                 metrics=None):
+        self.creds = creds
+        self.token_path = token_path
+        self.lead = lead
+        self.retry = retry
+        self.refreshes = 0
+        self.failures = 0
+        self._latency = metrics.histogram("token_refresh_seconds") if metrics is not None else None
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.describe("token_refreshes_total", "Background access token refreshes by outcome")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def seconds_until_due(self):
+        """Seconds until the token should be renewed; None if it never expires or cannot be refreshed."""
+        if not self.creds.refresh_token:
+            return None
+        if self.creds.token is None:
+            return 0.0
+        if self.creds.expiry is None:
+            return None
+        remaining = (self.creds.expiry - _utcnow()).total_seconds()
+        return max(0.0, remaining - self.lead)
+
+    def refresh(self):
+        """Renew the token now. Returns True on success; failures are counted and left to the caller."""
+        fresh = copy.copy(self.creds)
+        started = time.perf_counter()
+        try:
+            fresh.refresh(Request())
+        except Exception as e:
+            self.failures += 1
+            if self._metrics is not None:
+                self._metrics.count("token_refreshes_total", outcome="failed")
+            print(f"Token refresh failed ({e}); retrying in {self.retry}s.")
+            return False
+        finally:
+            if self._latency is not None:
+                self._latency.record(time.perf_counter() - started)
+        # token before expiry: a reader between the two sees a valid token with the old, still future, expiry
+        self.creds.token = fresh.token
+        self.creds.expiry = fresh.expiry
+        self.refreshes += 1
+        if self._metrics is not None:
+            self._metrics.count("token_refreshes_total", outcome="ok")
+        if self.token_path is not None:
+            save_token(fresh, self.token_path)
+        return True
+
+    def _delay_after_refresh(self):
+        delay = self.seconds_until_due()
+        if delay == 0:
+            # tokens live shorter than `lead`; renew at half-life instead of in a loop
+            delay = (self.creds.expiry - _utcnow()).total_seconds() / 2
+        return delay
+
+    def start(self):
+        """Refresh now if the token is already due (before any send starts), then keep it fresh in the background."""
+        delay = self.seconds_until_due()
+        if delay is None:
+            return self
+        if delay == 0:
+            delay = self._delay_after_refresh() if self.refresh() else self.retry
+        self._thread = threading.Thread(target=self._run, args=(delay,), name="token-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, delay):
+        while delay is not None and not self._stop.wait(delay):
+            delay = self._delay_after_refresh() if self.refresh() else self.retry
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def summary(self):
+        expiry = f", token valid until {self.creds.expiry:%H:%M:%S} UTC" if self.creds.expiry else ""
+        return f"{self.refreshes} background refreshes, {self.failures} failed{expiry}"